@@ -4,8 +4,19 @@ from flask_cors import CORS
 from extensions import limiter
 from intelligence import intel_bp
 
+try:
+    from json_provider import OrjsonProvider
+except ImportError:  # orjson not installed — keep Flask's stdlib JSON provider
+    OrjsonProvider = None
+
 app = Flask(__name__)
+if OrjsonProvider is not None:
+    app.json = OrjsonProvider(app)
+app.json.sort_keys = False  # key order is irrelevant to clients; skip the sort
 app.config['MAX_CONTENT_LENGTH'] = 50 * 1024 * 1024  # 50 MB upload limit
+# Behind a proxy that honours X-Sendfile, send_file() hands report downloads to the
+# proxy instead of streaming them through Python. Off by default.
+app.config['USE_X_SENDFILE'] = os.environ.get('USE_X_SENDFILE', '').lower() in ('1', 'true')
 
 ALLOWED_ORIGINS = [
     'https://exceltrans-frontend.onrender.com',
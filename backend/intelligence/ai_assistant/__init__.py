@@ -1,14 +1,16 @@
-from .provider_factory import AIProviderFactory, BaseAIProvider
+from .provider_factory import AIProviderFactory, BaseAIProvider, FallbackChainProvider
 from .prompt_builder import (
     build_nl_to_rule_prompt, build_template_suggest_prompt,
     build_chat_prompt,
     SYSTEM_PROMPT_NL_TO_RULE, SYSTEM_PROMPT_TEMPLATE_SUGGEST, SYSTEM_PROMPT_CHAT,
 )
 from .rule_extractor import parse_rule_from_ai, parse_template_slug
+from .response_cache import ResponseCache, response_cache
 
 __all__ = [
-    'AIProviderFactory', 'BaseAIProvider',
+    'AIProviderFactory', 'BaseAIProvider', 'FallbackChainProvider',
     'build_nl_to_rule_prompt', 'build_template_suggest_prompt', 'build_chat_prompt',
     'SYSTEM_PROMPT_NL_TO_RULE', 'SYSTEM_PROMPT_TEMPLATE_SUGGEST', 'SYSTEM_PROMPT_CHAT',
     'parse_rule_from_ai', 'parse_template_slug',
+    'ResponseCache', 'response_cache',
 ]
@@ -2,38 +2,43 @@
 Builds context-aware prompts for different wizard steps.
 """
 import json
-from typing import Dict, List, Optional
+from functools import lru_cache
+from typing import Dict, Optional, Sequence, Tuple
 
+from ..rule_engine.rule_schema import OPERATOR_NAMES, MATCH_METHOD_NAMES, FORMULA_ACTION_NAMES
 
-RULE_SCHEMA_SUMMARY = """
+
+# Built from the same constants the validator checks against, so the model is
+# never told about an operator/method/action the validator would reject.
+# Everything here is static: SYSTEM_PROMPT_NL_TO_RULE is byte-identical across
+# requests, which is what provider-side prompt caching keys on.
+RULE_SCHEMA_SUMMARY = f"""
 Valid rule types and their config structure:
 
 PRESENCE_RULE:
-  config: {
-    "only_in_file_b": {"outcome_label": "Addition", "color": "#C6EFCE"},
-    "only_in_file_a": {"outcome_label": "Deletion", "color": "#FFC7CE"}
-  }
+  config: {{
+    "only_in_file_b": {{"outcome_label": "Addition", "color": "#C6EFCE"}},
+    "only_in_file_a": {{"outcome_label": "Deletion", "color": "#FFC7CE"}}
+  }}
 
 CHANGE_RULE:
-  config: {"fields": ["Field1", "Field2"], "outcome_label": "Changed", "color": "#FFEB9C"}
+  config: {{"fields": ["Field1", "Field2"], "outcome_label": "Changed", "color": "#FFEB9C"}}
 
 CONDITION_RULE:
-  config: {
-    "conditions": [{"field": "FieldName", "operator": "OPERATOR", "value": "optional_value"}],
+  config: {{
+    "conditions": [{{"field": "FieldName", "operator": "OPERATOR", "value": "optional_value"}}],
     "condition_join": "AND",
-    "outcome_label": "Label {FieldName}",
+    "outcome_label": "Label {{FieldName}}",
     "color": "#FFC7CE"
-  }
-  Valid operators: is_empty, is_not_empty, equals, not_equals, contains, starts_with,
-                  changed_from_empty, changed_to_empty, date_is_before, date_is_after,
-                  changed_from_pattern, changed_to_pattern
+  }}
+  Valid operators: {', '.join(OPERATOR_NAMES)}
 
 ROW_MATCH:
-  config: {"method": "exact", "fuzzy_threshold": 0.8}
-  method: "exact" | "fuzzy"
+  config: {{"method": "exact", "fuzzy_threshold": 0.8}}
+  method: {' | '.join(f'"{m}"' for m in MATCH_METHOD_NAMES)}
 
 FORMULA_RULE:
-  config: {"column_actions": {"ColName": "compare_value|compare_expression|skip"}}
+  config: {{"column_actions": {{"ColName": "{'|'.join(FORMULA_ACTION_NAMES)}"}}}}
 """
 
 SYSTEM_PROMPT_NL_TO_RULE = f"""You are an Excel comparison rule converter.
@@ -81,9 +86,20 @@ Keep responses concise and practical. When you suggest a rule, format it as JSON
 """
 
 
-def build_nl_to_rule_prompt(natural_language: str, column_names: List[str]) -> str:
+@lru_cache(maxsize=256)
+def _quoted_cols_str(columns: Tuple[str, ...]) -> str:
+    return ', '.join(f'"{c}"' for c in columns)
+
+
+@lru_cache(maxsize=256)
+def _plain_cols_str(columns: Tuple[str, ...]) -> str:
+    return ', '.join(columns)
+
+
+def build_nl_to_rule_prompt(natural_language: str, column_names: Sequence[str]) -> str:
     """Build user prompt for NL → rule conversion."""
-    cols_str = ', '.join(f'"{c}"' for c in column_names)
+    # The wizard sends the same column list on every call for a sheet — join it once
+    cols_str = _quoted_cols_str(tuple(column_names))
     return f"""Available columns: [{cols_str}]
 
 User description: "{natural_language}"
@@ -91,8 +107,8 @@ User description: "{natural_language}"
 Output the rule JSON:"""
 
 
-def build_template_suggest_prompt(columns: List[str], sheet_name: str) -> str:
-    cols_str = ', '.join(columns[:30])  # Limit to avoid token overflow
+def build_template_suggest_prompt(columns: Sequence[str], sheet_name: str) -> str:
+    cols_str = _plain_cols_str(tuple(columns[:30]))  # Limit to avoid token overflow
     return f"""Sheet name: "{sheet_name}"
 Columns: {cols_str}
 
@@ -103,5 +119,6 @@ def build_chat_prompt(message: str, context: Optional[Dict] = None) -> str:
     """Build chat prompt with optional wizard context."""
     ctx_str = ''
     if context:
-        ctx_str = f"\nCurrent wizard context:\n{json.dumps(context, indent=2)}\n"
+        # Compact separators: same information, far fewer tokens than indent=2
+        ctx_str = f"\nCurrent wizard context:\n{json.dumps(context, separators=(',', ':'))}\n"
     return f"{ctx_str}\nUser: {message}"
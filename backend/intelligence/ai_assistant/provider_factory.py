@@ -1,13 +1,99 @@
 """
 Multi-provider AI abstraction layer. Supports Anthropic, OpenAI, and Google Gemini.
-Keys are passed per-request and never stored.
+Keys are passed per-request and never stored; SDK clients are cached by a digest
+of the key so repeat requests reuse the same HTTP connection pool.
 """
+import hashlib
 import logging
+import threading
+import time
 from abc import ABC, abstractmethod
-from typing import Optional
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from types import MappingProxyType
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
+
+try:
+    import anthropic
+except ImportError:  # SDK is optional until the provider is actually used
+    anthropic = None
+
+try:
+    from openai import OpenAI, APIConnectionError as OpenAIConnectionError
+except ImportError:
+    OpenAI = None
+    OpenAIConnectionError = None
+
+try:
+    from google import genai
+    from google.genai import types as genai_types
+except ImportError:
+    genai = None
+    genai_types = None
+
+try:
+    import httpx
+except ImportError:
+    httpx = None
 
 logger = logging.getLogger(__name__)
 
+# ── SDK client cache ──────────────────────────────────────────────────────────
+# Building an SDK client sets up a fresh HTTP session + TLS pool, which dominates
+# short completions. Clients are keyed by (provider, blake2b(api_key)) so the
+# plaintext key is never used as a dict key.
+CLIENT_CACHE_SIZE = 64
+_client_cache: "OrderedDict[Tuple[str, str], Any]" = OrderedDict()
+_client_cache_lock = threading.Lock()
+
+
+def _key_digest(api_key: str) -> str:
+    return hashlib.blake2b(api_key.encode('utf-8'), digest_size=16).hexdigest()
+
+
+def _get_cached_client(provider: str, api_key: str, build: Callable[[str], Any]) -> Any:
+    """Return a cached SDK client for (provider, api_key), building it on first use."""
+    cache_key = (provider, _key_digest(api_key))
+    with _client_cache_lock:
+        client = _client_cache.get(cache_key)
+        if client is not None:
+            _client_cache.move_to_end(cache_key)
+            return client
+
+    client = build(api_key)
+    with _client_cache_lock:
+        # Another thread may have built one concurrently — keep the first
+        client = _client_cache.setdefault(cache_key, client)
+        _client_cache.move_to_end(cache_key)
+        while len(_client_cache) > CLIENT_CACHE_SIZE:
+            _client_cache.popitem(last=False)
+    return client
+
+
+def _require(module: Any, package: str) -> None:
+    if module is None:
+        raise ImportError(f"The '{package}' package is required for this AI provider")
+
+
+# ── Transient-failure detection (drives FallbackChainProvider cooldowns) ─────
+_TRANSIENT_ERROR_TYPES = tuple(t for t in (
+    TimeoutError,
+    ConnectionError,
+    anthropic.APIConnectionError if anthropic else None,  # includes APITimeoutError
+    OpenAIConnectionError,
+    httpx.TransportError if httpx else None,
+) if t is not None)
+
+
+def _is_transient_error(exc: Exception) -> bool:
+    """Rate limits, 5xx responses, timeouts and connection failures."""
+    # anthropic/openai expose .status_code, google-genai exposes .code
+    status = getattr(exc, 'status_code', None) or getattr(exc, 'code', None)
+    if isinstance(status, int) and (status == 429 or status >= 500):
+        return True
+    return isinstance(exc, _TRANSIENT_ERROR_TYPES)
+
 
 class BaseAIProvider(ABC):
     @abstractmethod
@@ -15,6 +101,24 @@ class BaseAIProvider(ABC):
         """Send a completion request and return the text response."""
         ...
 
+    def complete_batch(self, system: str, users: List[str], max_tokens: int = 1024,
+                       max_concurrency: int = 8) -> List[Union[str, Exception]]:
+        """
+        Run several completions sharing one system prompt, overlapping their network
+        round-trips on a small thread pool (the cached SDK clients are thread-safe).
+        Results are in input order; a failed prompt yields its exception instead of raising.
+        """
+        def _one(user: str) -> Union[str, Exception]:
+            try:
+                return self.complete(system, user, max_tokens=max_tokens)
+            except Exception as e:
+                return e
+
+        if len(users) <= 1:
+            return [_one(u) for u in users]
+        with ThreadPoolExecutor(max_workers=min(max_concurrency, len(users))) as pool:
+            return list(pool.map(_one, users))
+
     def test_connection(self) -> bool:
         """Test the API key works by sending a minimal request."""
         try:
@@ -27,15 +131,19 @@ class BaseAIProvider(ABC):
 
 class AnthropicProvider(BaseAIProvider):
     def __init__(self, api_key: str, model: str = 'claude-haiku-4-5-20251001'):
-        import anthropic
+        _require(anthropic, 'anthropic')
         self.model = model
-        self.client = anthropic.Anthropic(api_key=api_key)
+        self.identity = ('anthropic', _key_digest(api_key))
+        self.client = _get_cached_client('anthropic', api_key,
+                                         lambda key: anthropic.Anthropic(api_key=key))
 
     def complete(self, system: str, user: str, max_tokens: int = 1024) -> str:
         message = self.client.messages.create(
             model=self.model,
             max_tokens=max_tokens,
-            system=system,
+            # System prompts are static per wizard step; mark them cacheable so repeat
+            # calls skip prefill (ignored by the API below the minimum cacheable size)
+            system=[{'type': 'text', 'text': system, 'cache_control': {'type': 'ephemeral'}}],
             messages=[{'role': 'user', 'content': user}]
         )
         return message.content[0].text
@@ -43,9 +151,10 @@ class AnthropicProvider(BaseAIProvider):
 
 class OpenAIProvider(BaseAIProvider):
     def __init__(self, api_key: str, model: str = 'gpt-4o-mini'):
-        from openai import OpenAI
+        _require(OpenAI, 'openai')
         self.model = model
-        self.client = OpenAI(api_key=api_key)
+        self.identity = ('openai', _key_digest(api_key))
+        self.client = _get_cached_client('openai', api_key, lambda key: OpenAI(api_key=key))
 
     def complete(self, system: str, user: str, max_tokens: int = 1024) -> str:
         response = self.client.chat.completions.create(
@@ -61,16 +170,15 @@ class OpenAIProvider(BaseAIProvider):
 
 class GeminiProvider(BaseAIProvider):
     def __init__(self, api_key: str, model: str = 'gemini-2.0-flash'):
-        from google import genai
+        _require(genai, 'google-genai')
         self.model = model
-        self._genai = genai
-        self.client = genai.Client(api_key=api_key)
+        self.identity = ('gemini', _key_digest(api_key))
+        self.client = _get_cached_client('gemini', api_key, lambda key: genai.Client(api_key=key))
 
     def complete(self, system: str, user: str, max_tokens: int = 1024) -> str:
-        from google.genai import types
         response = self.client.models.generate_content(
             model=self.model,
-            config=types.GenerateContentConfig(
+            config=genai_types.GenerateContentConfig(
                 system_instruction=system,
                 max_output_tokens=max_tokens,
             ),
@@ -79,8 +187,63 @@ class GeminiProvider(BaseAIProvider):
         return response.text
 
 
+# ── Fallback chain ────────────────────────────────────────────────────────────
+# Health state is per (provider, key digest) and shared across requests, so a
+# provider that is rate-limiting is skipped by every request until it cools down.
+MAX_COOLDOWN_SECONDS = 60
+_provider_health: Dict[Any, Tuple[int, float]] = {}  # identity → (failures, cooldown_until)
+_provider_health_lock = threading.Lock()
+
+
+class FallbackChainProvider(BaseAIProvider):
+    """
+    Tries providers in priority order. A transient failure (429, 5xx, timeout,
+    connection error) puts that provider into an exponential cooldown
+    (2**failures seconds, capped at MAX_COOLDOWN_SECONDS) and moves on to the next;
+    any other error also falls through but does not trigger a cooldown.
+    """
+
+    def __init__(self, providers: List[BaseAIProvider]):
+        if not providers:
+            raise ValueError("FallbackChainProvider needs at least one provider")
+        self.providers = providers
+        self.model = getattr(providers[0], 'model', '')
+
+    def complete(self, system: str, user: str, max_tokens: int = 1024) -> str:
+        last_error: Optional[Exception] = None
+        for provider in self.providers:
+            identity = getattr(provider, 'identity', (type(provider).__name__, id(provider)))
+            with _provider_health_lock:
+                _, cooldown_until = _provider_health.get(identity, (0, 0.0))
+            if cooldown_until > time.monotonic():
+                continue
+
+            try:
+                result = provider.complete(system, user, max_tokens=max_tokens)
+            except Exception as e:
+                last_error = e
+                if _is_transient_error(e):
+                    with _provider_health_lock:
+                        failures = _provider_health.get(identity, (0, 0.0))[0] + 1
+                        cooldown = min(MAX_COOLDOWN_SECONDS, 2 ** failures)
+                        _provider_health[identity] = (failures, time.monotonic() + cooldown)
+                    logger.warning(f"AI provider {identity[0]} failed ({e}); cooling down {cooldown}s")
+                else:
+                    logger.warning(f"AI provider {identity[0]} failed ({e}); trying next in chain")
+                continue
+
+            with _provider_health_lock:
+                _provider_health.pop(identity, None)
+            return result
+
+        if last_error is not None:
+            raise last_error
+        raise RuntimeError("All AI providers are cooling down after recent failures. Please retry shortly.")
+
+
 class AIProviderFactory:
-    SUPPORTED_PROVIDERS = {
+    # Read-only view: the registry is fixed at import, which lets list_providers() memoize
+    SUPPORTED_PROVIDERS = MappingProxyType({
         'anthropic': {
             'class': AnthropicProvider,
             'models': ['claude-haiku-4-5-20251001', 'claude-sonnet-4-6'],
@@ -96,19 +259,34 @@ class AIProviderFactory:
             'models': ['gemini-2.0-flash', 'gemini-2.5-pro-preview-03-25'],
             'default_model': 'gemini-2.0-flash',
         },
-    }
+    })
 
     @staticmethod
-    def get_provider(provider: str, api_key: str, model: Optional[str] = None) -> BaseAIProvider:
-        provider = provider.lower()
-        if provider not in AIProviderFactory.SUPPORTED_PROVIDERS:
-            raise ValueError(f"Unsupported provider '{provider}'. Supported: {list(AIProviderFactory.SUPPORTED_PROVIDERS)}")
+    def get_provider(provider: str, api_key: str, model: Optional[str] = None,
+                     fallback: Optional[List[Dict]] = None) -> BaseAIProvider:
+        """
+        Build a provider. With `fallback` — a list of {'provider', 'api_key', 'model'}
+        dicts — returns a FallbackChainProvider trying the primary first.
+        """
+        if fallback:
+            chain = [AIProviderFactory.get_provider(provider, api_key, model)]
+            for spec in fallback:
+                chain.append(AIProviderFactory.get_provider(
+                    spec['provider'], spec['api_key'], spec.get('model') or None,
+                ))
+            return FallbackChainProvider(chain)
+
+        providers = AIProviderFactory.SUPPORTED_PROVIDERS
+        # Callers normally pass lowercase names already — only fold case on a miss
+        cfg = providers.get(provider) or providers.get(provider.lower())
+        if cfg is None:
+            raise ValueError(f"Unsupported provider '{provider.lower()}'. Supported: {list(providers)}")
 
-        cfg = AIProviderFactory.SUPPORTED_PROVIDERS[provider]
         resolved_model = model or cfg['default_model']
         return cfg['class'](api_key=api_key, model=resolved_model)
 
     @staticmethod
+    @lru_cache(maxsize=1)
     def list_providers() -> dict:
         return {
             name: {'models': cfg['models'], 'default_model': cfg['default_model']}
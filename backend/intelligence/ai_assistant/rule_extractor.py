@@ -9,6 +9,41 @@ from typing import Dict, Optional, Tuple
 from ..rule_engine.rule_validator import validate_rule
 
 
+_JSON_BLOCK_RE = re.compile(r'```(?:json)?\s*(\{.*?\})\s*```', re.DOTALL)
+
+
+def _find_balanced_object(text: str) -> Optional[str]:
+    """
+    Return the substring from the first '{' to its matching '}'.
+    Linear scan that respects JSON string literals and backslash escapes,
+    so nested objects are handled and there is no regex backtracking.
+    """
+    start = text.find('{')
+    if start == -1:
+        return None
+    depth = 0
+    in_string = False
+    escaped = False
+    for i in range(start, len(text)):
+        ch = text[i]
+        if in_string:
+            if escaped:
+                escaped = False
+            elif ch == '\\':
+                escaped = True
+            elif ch == '"':
+                in_string = False
+        elif ch == '"':
+            in_string = True
+        elif ch == '{':
+            depth += 1
+        elif ch == '}':
+            depth -= 1
+            if depth == 0:
+                return text[start:i + 1]
+    return None
+
+
 def extract_json_from_response(text: str) -> Optional[str]:
     """Extract JSON object from AI response text."""
     # Try direct parse first
@@ -17,16 +52,12 @@ def extract_json_from_response(text: str) -> Optional[str]:
         return text
 
     # Look for ```json blocks
-    match = re.search(r'```(?:json)?\s*(\{.*?\})\s*```', text, re.DOTALL)
+    match = _JSON_BLOCK_RE.search(text)
     if match:
         return match.group(1)
 
     # Look for any JSON object in the text
-    match = re.search(r'(\{[^{}]*(?:\{[^{}]*\}[^{}]*)*\})', text, re.DOTALL)
-    if match:
-        return match.group(1)
-
-    return None
+    return _find_balanced_object(text)
 
 
 def parse_rule_from_ai(ai_response: str) -> Tuple[Optional[Dict], Optional[str]]:
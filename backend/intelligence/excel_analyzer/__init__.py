@@ -1,10 +1,12 @@
-from .sheet_reader import read_sheet_dual_pass, extract_values_grid, get_formula_cells
+from .sheet_reader import (
+    read_sheet_dual_pass, extract_values_grid, extract_formula_grid, get_formula_cells,
+)
 from .column_classifier import analyze_columns
 from .formula_classifier import classify_formula, classify_column_formulas
 from .header_detector import detect_header_row, extract_header_names
 
 __all__ = [
-    'read_sheet_dual_pass', 'extract_values_grid', 'get_formula_cells',
+    'read_sheet_dual_pass', 'extract_values_grid', 'extract_formula_grid', 'get_formula_cells',
     'analyze_columns', 'classify_formula', 'classify_column_formulas',
     'detect_header_row', 'extract_header_names',
 ]
@@ -5,6 +5,8 @@ import re
 from datetime import datetime, date
 from typing import Any, Dict, List, Optional
 
+import pandas as pd
+
 
 DATE_PATTERNS = [
     r'^\d{1,2}[/-]\d{1,2}[/-]\d{2,4}$',
@@ -12,27 +14,28 @@ DATE_PATTERNS = [
     r'^\d{1,2}\s+\w+\s+\d{4}$',
 ]
 
+# All DATE_PATTERNS fused into one anchored alternation, compiled once
+_DATE_RE = re.compile('^(?:' + '|'.join(p.strip('^$') for p in DATE_PATTERNS) + ')$')
+
+# Thousands separators / percent signs dropped before numeric parsing
+_NUM_STRIP = str.maketrans('', '', ',%')
+
 
 def _is_date_value(val: Any) -> bool:
-    if isinstance(val, (datetime, date)):
-        return True
     if isinstance(val, str):
-        for pattern in DATE_PATTERNS:
-            if re.match(pattern, val.strip()):
-                return True
-    return False
+        return _DATE_RE.match(val.strip()) is not None
+    return isinstance(val, (datetime, date))
 
 
 def _is_numeric_value(val: Any) -> bool:
-    if isinstance(val, (int, float)):
-        return True
     if isinstance(val, str):
         try:
-            float(val.replace(',', '').replace('%', '').strip())
+            float(val.translate(_NUM_STRIP).strip())
             return True
         except ValueError:
-            pass
-    return False
+            return False
+    # bool is an int subclass but TRUE/FALSE cells are not numeric data
+    return isinstance(val, (int, float)) and not isinstance(val, bool)
 
 
 def classify_column(values: List[Any], formula_count: int = 0, total_cells: int = 0) -> str:
@@ -49,8 +52,13 @@ def classify_column(values: List[Any], formula_count: int = 0, total_cells: int
     if total_cells > 0 and formula_count / max(total_cells, 1) > 0.3:
         return 'formula'
 
-    date_count = sum(1 for v in non_null if _is_date_value(v))
-    numeric_count = sum(1 for v in non_null if _is_numeric_value(v))
+    # Single pass — date and numeric matches are mutually exclusive
+    date_count = numeric_count = 0
+    for v in non_null:
+        if _is_date_value(v):
+            date_count += 1
+        elif _is_numeric_value(v):
+            numeric_count += 1
     text_count = len(non_null) - date_count - numeric_count
 
     total = len(non_null)
@@ -80,21 +88,27 @@ def analyze_columns(values_grid: List[List[Any]], formula_grid: List[List[Option
     if not data_rows:
         return []
 
-    num_cols = max(len(row) for row in data_rows)
+    # One object-dtype frame per grid: ragged rows are padded with None and
+    # cell values keep their Python types for classify_column/sample_values.
+    data_df = pd.DataFrame(data_rows, dtype=object)
+    num_cols = data_df.shape[1]
+    null_rates = (data_df.isna() | data_df.eq('')).mean(axis=0)
+
+    formula_df = pd.DataFrame(formula_data_rows, dtype=object).reindex(columns=range(num_cols))
+    formula_counts = formula_df.notna().sum(axis=0)
+
     results = []
 
     for col_idx in range(num_cols):
-        col_values = [row[col_idx] if col_idx < len(row) else None for row in data_rows]
-        col_formulas = [row[col_idx] if col_idx < len(row) else None for row in formula_data_rows]
-
-        formula_count = sum(1 for f in col_formulas if f is not None)
-        total_cells = len([v for v in col_values if v is not None])
+        col_values = data_df[col_idx].tolist()
+        formula_count = int(formula_counts[col_idx])
 
         # Sample formula for display
-        sample_formula = next((f for f in col_formulas if f is not None), None)
+        col_formulas = formula_df[col_idx]
+        first_formula = col_formulas.first_valid_index()
+        sample_formula = col_formulas[first_formula] if first_formula is not None else None
 
-        null_count = sum(1 for v in col_values if v is None or v == '')
-        null_rate = null_count / len(col_values) if col_values else 0.0
+        null_rate = float(null_rates[col_idx])
 
         col_type = classify_column(col_values, formula_count, len(col_values))
 
@@ -2,6 +2,8 @@
 Classifies Excel formulas into categories: arithmetic, lookup, IF, concat, reference, other.
 """
 import re
+from collections import Counter
+from functools import lru_cache
 from typing import Optional
 
 
@@ -15,6 +17,24 @@ DATE_FUNCS = {'DATE', 'TODAY', 'NOW', 'YEAR', 'MONTH', 'DAY', 'DATEDIF', 'EDATE'
 LOGIC_FUNCS = {'IF', 'IFS', 'AND', 'OR', 'NOT', 'IFERROR', 'IFNA', 'SWITCH'}
 ARITHMETIC_OPS = re.compile(r'[+\-*/]')
 
+_FUNC_RE = re.compile(r'([A-Z]+)\s*\(', re.IGNORECASE)
+_REF_RE = re.compile(r'^=[A-Z0-9!$]+$', re.IGNORECASE)
+# A1-style cell reference not glued to a name, number, or call — e.g. B2, $C$10
+_CELL_REF_RE = re.compile(r'(?<![A-Z0-9_.])\$?[A-Z]{1,3}\$?[0-9]+(?![0-9A-Z_(])', re.IGNORECASE)
+
+# Function name → (priority, type). Lower priority wins when a formula mixes
+# families, e.g. =IF(VLOOKUP(...)) is 'lookup'.
+_FUNC_TO_TYPE = {}
+for _priority, (_funcs, _ftype) in enumerate([
+    (LOOKUP_FUNCS, 'lookup'),
+    (LOGIC_FUNCS, 'IF'),
+    (TEXT_FUNCS, 'concat'),
+    (DATE_FUNCS, 'date'),
+    (AGGREGATE_FUNCS, 'aggregate'),
+]):
+    for _fn in _funcs:
+        _FUNC_TO_TYPE.setdefault(_fn, (_priority, _ftype))
+
 
 def classify_formula(formula: str) -> Optional[str]:
     """
@@ -25,31 +45,34 @@ def classify_formula(formula: str) -> Optional[str]:
     """
     if not formula or not formula.startswith('='):
         return None
+    # Filled-down formulas differ only in cell coordinates (=B2*C2, =B3*C3, ...).
+    # Rewriting every reference to A1 leaves the classification unchanged and
+    # collapses a whole column onto one cache entry.
+    return _classify_formula_shape(_CELL_REF_RE.sub('A1', formula))
 
-    formula_upper = formula.upper()
 
-    # Extract all function names
-    funcs = set(re.findall(r'([A-Z]+)\s*\(', formula_upper))
-
-    if funcs & LOOKUP_FUNCS:
-        return 'lookup'
-    if funcs & LOGIC_FUNCS:
-        return 'IF'
-    if funcs & TEXT_FUNCS:
-        return 'concat'
-    if funcs & DATE_FUNCS:
-        return 'date'
-    if funcs & AGGREGATE_FUNCS:
-        return 'aggregate'
+@lru_cache(maxsize=16384)
+def _classify_formula_shape(formula: str) -> str:
+    has_funcs = False
+    best = None
+    for match in _FUNC_RE.finditer(formula):
+        has_funcs = True
+        hit = _FUNC_TO_TYPE.get(match.group(1).upper())
+        if hit is not None and (best is None or hit[0] < best[0]):
+            best = hit
+            if best[0] == 0:
+                break  # highest-priority family, nothing can beat it
+    if best is not None:
+        return best[1]
 
     # Pure cell reference with no function
-    if not funcs:
+    if not has_funcs:
         # Check for arithmetic operators between cell refs
         # e.g., =A1*B1, =D2+E2
-        if ARITHMETIC_OPS.search(formula[1:]):
+        if ARITHMETIC_OPS.search(formula, 1):
             return 'arithmetic'
         # Simple cell reference like =A1 or =Sheet1!A1
-        if re.match(r'^=[A-Z0-9!$]+$', formula.upper()):
+        if _REF_RE.match(formula):
             return 'reference'
         return 'arithmetic'
 
@@ -60,12 +83,13 @@ def classify_column_formulas(formula_list: list) -> Optional[str]:
     """
     Given a list of formula strings for a column, return the dominant formula type.
     """
-    types = [classify_formula(f) for f in formula_list if f]
-    if not types:
-        return None
     # Return the most common type
-    from collections import Counter
-    counts = Counter(t for t in types if t)
+    counts = Counter()
+    for f in formula_list:
+        if f:
+            t = classify_formula(f)
+            if t:
+                counts[t] += 1
     if not counts:
         return None
     return counts.most_common(1)[0][0]
@@ -1,28 +1,19 @@
 """
 Auto-detects header rows in Excel sheets by finding the densest non-numeric row.
 """
-from typing import Any, List, Optional
+from typing import Any, List, Optional, Tuple
 
 
-def _is_text(val: Any) -> bool:
-    if val is None:
-        return False
-    if isinstance(val, str) and val.strip():
-        return True
-    return False
-
-
-def _row_text_density(row: List[Any]) -> float:
-    """Fraction of non-null cells that are text."""
-    non_null = [v for v in row if v is not None and v != '']
-    if not non_null:
-        return 0.0
-    text_cells = sum(1 for v in non_null if _is_text(v))
-    return text_cells / len(non_null)
-
-
-def _row_non_null_count(row: List[Any]) -> int:
-    return sum(1 for v in row if v is not None and v != '')
+def _row_stats(row: List[Any]) -> Tuple[int, int]:
+    """Return (non_null_count, text_count) for a row in a single pass."""
+    non_null = text_cells = 0
+    for v in row:
+        if v is None or v == '':
+            continue
+        non_null += 1
+        if type(v) is str and v.strip():
+            text_cells += 1
+    return non_null, text_cells
 
 
 def detect_header_row(values_grid: List[List[Any]], max_scan_rows: int = 30) -> int:
@@ -45,8 +36,13 @@ def detect_header_row(values_grid: List[List[Any]], max_scan_rows: int = 30) ->
 
     for i in range(scan_limit):
         row = values_grid[i]
-        density = _row_text_density(row)
-        fill = _row_non_null_count(row) / max(len(row), 1)
+        if not row:
+            continue
+        non_null, text_cells = _row_stats(row)
+        if not non_null:
+            continue  # Blank rows score 0 and can never beat a filled row
+        density = text_cells / non_null
+        fill = non_null / len(row)
 
         # Score: high text density + reasonable fill rate
         score = density * 0.7 + fill * 0.3
@@ -4,97 +4,129 @@ Dual-pass openpyxl reader: reads formulas AND computed values from Excel sheets.
 import openpyxl
 from openpyxl.cell.cell import MergedCell
 from openpyxl.utils import get_column_letter
-from typing import Any, Dict, List, Optional, Tuple
+from typing import Any, Dict, List, Optional
 
 
 def read_sheet_dual_pass(filepath: str) -> Dict[str, Any]:
     """
-    Perform two openpyxl loads:
-    1. data_only=False → capture raw formulas
-    2. data_only=True  → capture computed values (cached by Excel)
-
-    Returns a dict keyed by sheet name with cell-level data merged.
+    Perform up to two openpyxl loads:
+    1. data_only=False → capture raw formulas (and the values of plain cells)
+    2. data_only=True  → capture computed values (cached by Excel) for formula cells
+
+    The second load is read-only, streamed in lockstep row order, and skipped
+    entirely when the first pass finds no formula cells.
+
+    Returns a dict keyed by sheet name. Cell data is stored column-parallel
+    (one 2D grid per attribute) rather than as a dict per cell:
+        values      — computed value per cell
+        formulas    — formula string per cell, None for non-formula cells
+        data_types  — openpyxl data_type per cell (None for merged placeholders)
+        col_letters — column letter per column position, shared by all rows
+    Grid position [r][c] is row r + 1, column c + 1.
     """
     formula_wb = openpyxl.load_workbook(filepath, data_only=False)
-    value_wb = openpyxl.load_workbook(filepath, data_only=True, read_only=True)
 
     sheets = {}
+    # sheet_name → {row_pos: [col_pos, ...]} for formula cells awaiting computed values
+    pending_values: Dict[str, Dict[int, List[int]]] = {}
     for sheet_name in formula_wb.sheetnames:
         f_ws = formula_wb[sheet_name]
-        v_ws = value_wb[sheet_name] if sheet_name in value_wb.sheetnames else None
-
-        rows = []
-        v_row_iter = v_ws.iter_rows() if v_ws is not None else None
-        for row_idx, f_row in enumerate(f_ws.iter_rows(), start=1):
-            v_row = next(v_row_iter) if v_row_iter is not None else None
-            v_vals = {vc.column: vc.value for vc in v_row if hasattr(vc, 'column') and vc.column is not None} if v_row else {}
 
-            row_data = []
-            for cell in f_row:
+        values: List[List[Any]] = []
+        formulas: List[List[Optional[str]]] = []
+        data_types: List[List[Optional[str]]] = []
+        formula_positions: Dict[int, List[int]] = {}
+        for row_pos, f_row in enumerate(f_ws.iter_rows()):
+            row_values = []
+            row_formulas = []
+            row_types = []
+            for col_pos, cell in enumerate(f_row):
                 # MergedCell placeholders cover non-anchor positions of merged ranges.
-                # They have no value, formula, or column_letter — treat as empty.
+                # They have no value or formula — treat as empty.
                 if isinstance(cell, MergedCell):
-                    row_data.append({
-                        'row': row_idx,
-                        'col': cell.column,
-                        'col_letter': get_column_letter(cell.column),
-                        'formula': None,
-                        'value': None,
-                        'is_formula': False,
-                        'data_type': None,
-                    })
+                    row_values.append(None)
+                    row_formulas.append(None)
+                    row_types.append(None)
                     continue
 
-                formula_val = cell.value
-                is_formula = isinstance(formula_val, str) and formula_val.startswith('=')
-
-                # Get computed value from second pass via O(1) column lookup
-                computed = v_vals.get(cell.column)
-
-                row_data.append({
-                    'row': row_idx,
-                    'col': cell.column,
-                    'col_letter': cell.column_letter,
-                    'formula': formula_val if is_formula else None,
-                    'value': computed if is_formula else formula_val,
-                    'is_formula': is_formula,
-                    'data_type': cell.data_type,
-                })
-            rows.append(row_data)
-
+                cell_val = cell.value
+                if isinstance(cell_val, str) and cell_val.startswith('='):
+                    # Computed value is filled in by the value pass below
+                    formula_positions.setdefault(row_pos, []).append(col_pos)
+                    row_values.append(None)
+                    row_formulas.append(cell_val)
+                else:
+                    row_values.append(cell_val)
+                    row_formulas.append(None)
+                row_types.append(cell.data_type)
+            values.append(row_values)
+            formulas.append(row_formulas)
+            data_types.append(row_types)
+
+        max_col = max((len(r) for r in values), default=0)
         sheets[sheet_name] = {
-            'rows': rows,
+            'values': values,
+            'formulas': formulas,
+            'data_types': data_types,
+            'col_letters': [get_column_letter(c) for c in range(1, max_col + 1)],
             'max_row': f_ws.max_row,
             'max_col': f_ws.max_column,
             'merged_cells': [str(m) for m in f_ws.merged_cells.ranges],
         }
+        if formula_positions:
+            pending_values[sheet_name] = formula_positions
 
     formula_wb.close()
-    value_wb.close()
+
+    if pending_values:
+        value_wb = openpyxl.load_workbook(filepath, data_only=True, read_only=True, keep_links=False)
+        for sheet_name, formula_positions in pending_values.items():
+            if sheet_name not in value_wb.sheetnames:
+                continue
+            values = sheets[sheet_name]['values']
+            # Only read the window that actually contains formulas: rows and columns
+            # outside it are never materialised. Rows come back in lockstep order and
+            # each value tuple is indexed positionally — no per-row dict.
+            first_row = min(formula_positions)
+            first_col = min(min(cols) for cols in formula_positions.values())
+            last_col = max(max(cols) for cols in formula_positions.values())
+            v_rows = value_wb[sheet_name].iter_rows(
+                min_row=first_row + 1, max_row=max(formula_positions) + 1,
+                min_col=first_col + 1, max_col=last_col + 1, values_only=True,
+            )
+            for row_pos, v_row in enumerate(v_rows, start=first_row):
+                for col_pos in formula_positions.get(row_pos, ()):
+                    offset = col_pos - first_col
+                    if offset < len(v_row):
+                        values[row_pos][col_pos] = v_row[offset]
+        value_wb.close()
+
     return sheets
 
 
 def extract_values_grid(sheet_data: Dict[str, Any]) -> List[List[Any]]:
-    """Extract just the computed values as a 2D grid."""
-    return [[cell['value'] for cell in row] for row in sheet_data['rows']]
+    """Return the computed values as a 2D grid (shared, not copied)."""
+    return sheet_data['values']
 
 
 def extract_formula_grid(sheet_data: Dict[str, Any]) -> List[List[Optional[str]]]:
-    """Extract formula strings as a 2D grid (None for non-formula cells)."""
-    return [[cell['formula'] for cell in row] for row in sheet_data['rows']]
+    """Return formula strings as a 2D grid (None for non-formula cells; shared, not copied)."""
+    return sheet_data['formulas']
 
 
 def get_formula_cells(sheet_data: Dict[str, Any]) -> List[Dict[str, Any]]:
     """Return a flat list of all formula cells with their location and formula string."""
+    col_letters = sheet_data['col_letters']
+    values = sheet_data['values']
     formula_cells = []
-    for row in sheet_data['rows']:
-        for cell in row:
-            if cell['is_formula']:
+    for row_pos, row_formulas in enumerate(sheet_data['formulas']):
+        for col_pos, formula in enumerate(row_formulas):
+            if formula is not None:
                 formula_cells.append({
-                    'row': cell['row'],
-                    'col': cell['col'],
-                    'col_letter': cell['col_letter'],
-                    'formula': cell['formula'],
-                    'value': cell['value'],
+                    'row': row_pos + 1,
+                    'col': col_pos + 1,
+                    'col_letter': col_letters[col_pos],
+                    'formula': formula,
+                    'value': values[row_pos][col_pos],
                 })
     return formula_cells
@@ -1,3 +1,3 @@
-from .report_generator import build_comparison_report
+from .report_generator import build_comparison_report, write_comparison_report
 
-__all__ = ['build_comparison_report']
+__all__ = ['build_comparison_report', 'write_comparison_report']
@@ -3,39 +3,126 @@ Generates Excel comparison reports using openpyxl.
 Supports multiple rule output columns, column filtering, and custom column order.
 """
 import io
+import sys
+import numpy as np
 import openpyxl
+from openpyxl.cell import WriteOnlyCell
 from openpyxl.styles import PatternFill, Font, Alignment, Border, Side
 from openpyxl.utils import get_column_letter
-from typing import Any, Dict, List, Optional
-from datetime import datetime
-
-
-_CHANGED_FILL = PatternFill(start_color='FFEB9C', end_color='FFEB9C', fill_type='solid')
-
-
-def _hex_to_fill(hex_color: Optional[str]) -> Optional[PatternFill]:
-    """Convert #RRGGBB to openpyxl PatternFill."""
+from openpyxl.worksheet.dimensions import ColumnDimension
+from openpyxl.writer.excel import ExcelWriter
+from functools import lru_cache
+from itertools import groupby
+from typing import Any, BinaryIO, Callable, Dict, Iterable, List, Optional, Tuple, Union
+from datetime import date, datetime, time, timedelta, timezone
+from zipfile import ZIP_DEFLATED, ZIP_STORED, ZipFile
+
+try:
+    import pyexcelerate
+except ImportError:  # optional: faster writer for unstyled reports (opt-in via fast_path)
+    pyexcelerate = None
+
+
+@lru_cache(maxsize=None)
+def _fill_for(argb: str) -> PatternFill:
+    """Shared solid fill for an 8-char ARGB color (style objects are immutable)."""
+    return PatternFill(start_color=argb, end_color=argb, fill_type='solid')
+
+
+CHANGED_FILL = _fill_for('FFFFEB9C')
+HEADER_FILL = _fill_for('FF366092')
+HEADER_FONT = Font(bold=True, color='FFFFFFFF', name='Calibri', size=11)
+# Only the header row sets an alignment; body cells keep the default
+HEADER_ALIGN = Alignment(horizontal='center', vertical='center', wrap_text=True)
+SUMMARY_FILL = _fill_for('FFD9E1F2')
+TITLE_FONT = Font(bold=True, size=14)
+BOLD_FONT = Font(bold=True)
+
+# Summary sheet (label, result['summary'] key) rows
+_SUMMARY_ROWS = (
+    ('Total rows processed', 'total'),
+    ('Additions (new in File B)', 'additions'),
+    ('Deletions (removed from File A)', 'deletions'),
+    ('Changes (modified fields)', 'changes'),
+    ('Unchanged', 'unchanged'),
+)
+
+
+@lru_cache(maxsize=256)
+def _normalize_argb(hex_color: Optional[str]) -> Optional[str]:
+    """Normalize #RRGGBB / RRGGBB / AARRGGBB to 8-char ARGB (opaque when no alpha given)."""
     if not hex_color:
         return None
-    color = hex_color.lstrip('#')
+    color = hex_color[1:] if hex_color[0] == '#' else hex_color
     if len(color) == 6:
-        return PatternFill(start_color=color, end_color=color, fill_type='solid')
+        return 'FF' + color.upper()
+    if len(color) == 8:
+        return color.upper()
     return None
 
 
-def _make_header_fill() -> PatternFill:
-    return PatternFill(start_color='366092', end_color='366092', fill_type='solid')
-
-
-def _make_header_font() -> Font:
-    return Font(bold=True, color='FFFFFF', name='Calibri', size=11)
+# Number formats openpyxl applies to temporal values; pyexcelerate writes bare serials
+_TEMPORAL_FORMATS = (
+    (datetime, 'yyyy-mm-dd h:mm:ss'),
+    (date, 'yyyy-mm-dd'),
+    (time, 'h:mm:ss'),
+)
+# openpyxl writes durations as fractional days in this format
+_DURATION_FORMAT = '[hh]:mm:ss'
+
+
+def _write_plain_report(
+    output: Union[str, BinaryIO],
+    sheet_name: str,
+    headers: List[str],
+    rows: List[List[Any]],
+    col_widths: List[int],
+) -> None:
+    """pyexcelerate writer for unstyled reports: same header style, widths and frozen header row."""
+    wb = pyexcelerate.Workbook()
+    ws = wb.new_sheet(sheet_name, data=[headers])
+    header_style = pyexcelerate.Style(
+        font=pyexcelerate.Font(bold=True, color=pyexcelerate.Color(0xFF, 0xFF, 0xFF), family='Calibri', size=11),
+        fill=pyexcelerate.Fill(background=pyexcelerate.Color(0x36, 0x60, 0x92)),
+        alignment=pyexcelerate.Alignment(horizontal='center', vertical='center', wrap_text=True),
+    )
+    for col_idx, width in enumerate(col_widths, start=1):
+        ws.set_cell_style(1, col_idx, header_style)
+        ws.set_col_style(col_idx, pyexcelerate.Style(size=width + 2))
+    ws.panes = pyexcelerate.Panes(y=1)
+
+    temporal_styles = {cls: pyexcelerate.Style(format=pyexcelerate.Format(fmt)) for cls, fmt in _TEMPORAL_FORMATS}
+    duration_style = pyexcelerate.Style(format=pyexcelerate.Format(_DURATION_FORMAT))
+    for row_idx, values in enumerate(rows, start=2):
+        for col_idx, value in enumerate(values, start=1):
+            if isinstance(value, np.generic):
+                value = value.item()  # NumPy scalars as the matching Python type
+            # Empty strings and NaN are left as blank cells, as openpyxl does
+            if value is None or value == '' or value != value:
+                continue
+            if isinstance(value, timedelta):
+                ws.set_cell_value(row_idx, col_idx, value.total_seconds() / 86400)
+                ws.set_cell_style(row_idx, col_idx, duration_style)
+                continue
+            ws.set_cell_value(row_idx, col_idx, value)
+            if isinstance(value, (datetime, date, time)):
+                cls = next(c for c, _ in _TEMPORAL_FORMATS if isinstance(value, c))
+                ws.set_cell_style(row_idx, col_idx, temporal_styles[cls])
+    wb.save(output)
 
 
-def _make_summary_title_fill() -> PatternFill:
-    return PatternFill(start_color='D9E1F2', end_color='D9E1F2', fill_type='solid')
+def _save_workbook(wb: openpyxl.Workbook, output: Union[str, BinaryIO], compression_level: int) -> None:
+    """openpyxl's save_workbook, with a caller-chosen zip compression level."""
+    if compression_level:
+        archive = ZipFile(output, 'w', ZIP_DEFLATED, allowZip64=True, compresslevel=compression_level)
+    else:
+        archive = ZipFile(output, 'w', ZIP_STORED, allowZip64=True)
+    wb.properties.modified = datetime.now(tz=timezone.utc).replace(tzinfo=None)
+    ExcelWriter(wb, archive).save()
 
 
-def build_comparison_report(
+def write_comparison_report(
+    output: Union[str, BinaryIO],
     result: Dict[str, Any],
     template_name: str,
     compare_fields: List[str],
@@ -47,33 +134,42 @@ def build_comparison_report(
     output_sheet_name: str = 'Comparison',
     included_columns: Optional[List[str]] = None,
     column_order: Optional[List[str]] = None,
-) -> bytes:
+    extra_rule_cols: Optional[List[str]] = None,
+    fast_path: bool = False,
+    compression_level: int = 6,
+) -> None:
     """
-    Build an Excel workbook from the rule executor result dict.
+    Build an Excel workbook from the rule executor result dict and save it to `output`
+    (a file path, or any writable binary file-like).
     Supports multiple rule output columns, included_columns filter, and column_order.
-
-    Returns raw bytes of the .xlsx file.
+    result['rows'] may be any iterable of row dicts. With extra_rule_cols given it is
+    consumed in a single pass; otherwise a lazy iterable is buffered into a list first,
+    since rule output column names must be discovered before the header is written.
+    fast_path=True opts unstyled reports into pyexcelerate when it is installed (it is
+    not in requirements.txt); by default every report goes through openpyxl.
+    compression_level (0-9) sets the openpyxl writer's DEFLATE level; 0 stores the
+    xlsx parts uncompressed, for consumers that compress the response themselves.
     """
-    wb = openpyxl.Workbook()
-
     # ── Main comparison sheet ──────────────────────────────────────────────────
-    ws = wb.active
     safe_name = (output_sheet_name or 'Comparison')[:31]
-    ws.title = safe_name
 
     # Collect all data fields (key + display + compare)
     all_data_fields = list(dict.fromkeys(key_fields + display_fields + compare_fields))
 
-    # Collect extra rule output column names from row data
-    extra_rule_cols: List[str] = []
-    seen_extra: set = set()
-    for row in result.get('rows', []):
-        for col_name in row.get('output_columns', {}):
-            if col_name == 'Remarks':
-                continue
-            if col_name not in seen_extra:
-                extra_rule_cols.append(col_name)
-                seen_extra.add(col_name)
+    rows: Iterable[Dict[str, Any]] = result.get('rows', [])
+
+    # Extra rule output column names, in first-seen order across the rows,
+    # unless the caller already knows them
+    if extra_rule_cols is None:
+        if not isinstance(rows, (list, tuple)):
+            rows = list(rows)
+        extra_rule_cols = list({
+            col_name: None
+            for row in rows
+            for col_name in row.get('output_columns', ())
+            if col_name != 'Remarks'
+        })
+    seen_extra = frozenset(extra_rule_cols)
 
     # Build full header list: data fields + Remarks + extra rule columns
     all_headers: List[str] = list(all_data_fields)
@@ -87,95 +183,133 @@ def build_comparison_report(
         included_set = set(included_columns)
         all_headers = [h for h in all_headers if h in included_set]
 
-    # Apply column_order reordering
+    # Apply column_order reordering: ordered columns first, then the rest in
+    # their natural order (single stable partition, no sort)
     if column_order:
-        order_map = {col: i for i, col in enumerate(column_order)}
-        def _sort_key(h: str) -> int:
-            return order_map.get(h, len(column_order))
-        all_headers = sorted(all_headers, key=_sort_key)
+        header_set = set(all_headers)
+        order_set = set(column_order)
+        all_headers = ([h for h in dict.fromkeys(column_order) if h in header_set]
+                       + [h for h in all_headers if h not in order_set])
 
-    # Track max column widths during write (avoids a second O(rows×cols) pass)
+    # Field names are a small fixed vocabulary: intern them once up front
+    all_headers = [sys.intern(h) for h in all_headers]
+
+    # Resolve cell values and max column widths up front: a write-only sheet emits
+    # its column widths and freeze pane when the first row is appended.
     col_widths = [max(10, len(h)) for h in all_headers]
 
-    # Write headers
-    for col_idx, header in enumerate(all_headers, start=1):
-        cell = ws.cell(row=1, column=col_idx, value=header)
-        cell.fill = _make_header_fill()
-        cell.font = _make_header_font()
-        cell.alignment = Alignment(horizontal='center', vertical='center', wrap_text=True)
-
-    # Per-report fill cache: reuse PatternFill objects for identical row colors
-    fill_cache: dict = {}
-
-    def _get_fill(hex_color: str) -> PatternFill:
-        if hex_color not in fill_cache:
-            fill_cache[hex_color] = _hex_to_fill(hex_color)
-        return fill_cache[hex_color]
-
-    # Write data rows — track column widths inline
-    for row_idx, row_data in enumerate(result.get('rows', []), start=2):
-        row_color = row_data.get('color')
-        changed_fields = set(row_data.get('changed_fields', []))
-        output_cols_data = row_data.get('output_columns', {})
-        row_fill = _get_fill(row_color) if row_color else None
-
-        for col_idx, field in enumerate(all_headers, start=1):
-            # Determine cell value based on field type
-            if field == 'Remarks':
-                value = output_cols_data.get('Remarks', {}).get('label', row_data.get('remarks', ''))
-            elif field in seen_extra:
-                value = output_cols_data.get(field, {}).get('label', '')
-            else:
-                value = row_data.get(field)
-
-            cell = ws.cell(row=row_idx, column=col_idx, value=value)
-            cell.alignment = Alignment(vertical='center', wrap_text=False)
-
-            # Track column width
-            if value is not None:
-                col_widths[col_idx - 1] = min(40, max(col_widths[col_idx - 1], len(str(value))))
-
-            # Row-level coloring (reuses cached fill object)
-            if row_fill:
-                cell.fill = row_fill
-
-            # Override with cell-level change highlight if applicable (reuses module singleton)
-            if highlight_changed_cells and field in changed_fields and row_color is None:
-                cell.fill = _CHANGED_FILL
-
-    # Apply collected column widths
-    for col_idx, width in enumerate(col_widths, start=1):
-        ws.column_dimensions[get_column_letter(col_idx)].width = width + 2
+    # The field → value source mapping is fixed per report, so resolve it once
+    # into one getter per column instead of branching on every cell.
+    getters: List[Callable[[Dict[str, Any]], Any]] = []
+    for field in all_headers:
+        if field == 'Remarks':
+            getters.append(lambda rd: rd.get('output_columns', {}).get('Remarks', {}).get('label', rd.get('remarks', '')))
+        elif field in seen_extra:
+            getters.append(lambda rd, f=field: rd.get('output_columns', {}).get(f, {}).get('label', ''))
+        else:
+            getters.append(lambda rd, f=field: rd.get(f))
+
+    # (values, color, changed_fields) per row — the only per-row state kept for writing
+    row_values: List[Tuple[List[Any], Optional[str], Iterable[str]]] = []
+    for row_data in rows:
+        values = [getter(row_data) for getter in getters]
+        # Track column widths (capped at 40; saturated columns are no longer measured)
+        for col_idx, value in enumerate(values):
+            width = col_widths[col_idx]
+            if width < 40 and value is not None:
+                n = len(value) if isinstance(value, str) else len(str(value))
+                if n > width:
+                    col_widths[col_idx] = n if n < 40 else 40
+        row_values.append((values, row_data.get('color'), row_data.get('changed_fields', ())))
+
+    # Reports with no row fills, change highlights or summary sheet are plain
+    # tabular data: hand them to pyexcelerate when the caller opted in and it is installed
+    if fast_path and pyexcelerate is not None and not include_summary and not any(
+        _normalize_argb(color) or (highlight_changed_cells and color is None and changed)
+        for _, color, changed in row_values
+    ):
+        _write_plain_report(output, safe_name, all_headers, [v for v, _, _ in row_values], col_widths)
+        return
+
+    # Write-only workbook: rows are streamed to the sheet XML on append instead of
+    # building the full in-memory cell grid.
+    wb = openpyxl.Workbook(write_only=True)
+    ws = wb.create_sheet(title=safe_name)
+
+    # Apply collected column widths — one <col min..max> entry per run of equal widths
+    col_idx = 1
+    for width, run in groupby(col_widths):
+        span = len(list(run))
+        letter = get_column_letter(col_idx)
+        ws.column_dimensions[letter] = ColumnDimension(
+            ws, index=letter, width=width + 2, min=col_idx, max=col_idx + span - 1,
+        )
+        col_idx += span
 
     ws.freeze_panes = 'A2'
 
+    # Write headers
+    header_cells = []
+    for header in all_headers:
+        cell = WriteOnlyCell(ws, value=header)
+        cell.fill = HEADER_FILL
+        cell.font = HEADER_FONT
+        cell.alignment = HEADER_ALIGN
+        header_cells.append(cell)
+    ws.append(header_cells)
+
+    # Write data rows. Unstyled cells are appended as plain values; only cells
+    # carrying a fill are wrapped in a WriteOnlyCell (styled before append).
+    for values, row_color, changed in row_values:
+        changed_fields = set(changed)
+        # Per-row invariants: the shared row fill, and whether change highlights
+        # can apply at all (only on uncoloured rows with changed fields)
+        row_argb = _normalize_argb(row_color)
+        row_fill = _fill_for(row_argb) if row_argb else None
+        check_changes = highlight_changed_cells and row_color is None and bool(changed_fields)
+
+        if row_fill is None and not check_changes:
+            ws.append(values)
+            continue
+
+        row_cells: List[Any] = list(values)
+        for col_idx, field in enumerate(all_headers):
+            # Row-level coloring, overridden by the cell-level change highlight
+            fill = CHANGED_FILL if check_changes and field in changed_fields else row_fill
+            if fill is not None:
+                cell = WriteOnlyCell(ws, value=values[col_idx])
+                cell.fill = fill
+                row_cells[col_idx] = cell
+        ws.append(row_cells)
+
     # ── Summary sheet ──────────────────────────────────────────────────────────
     if include_summary:
         summary_data = result.get('summary', {})
         ws_sum = wb.create_sheet(title='Summary')
+        ws_sum.column_dimensions['A'].width = 40
+        ws_sum.column_dimensions['B'].width = 15
 
-        ws_sum.cell(row=1, column=1, value=f'{template_name} — Comparison Summary').font = Font(bold=True, size=14)
-        ws_sum.cell(row=2, column=1, value=f'Generated: {datetime.now().strftime("%d %b %Y %H:%M")}')
+        title_cell = WriteOnlyCell(ws_sum, value=f'{template_name} — Comparison Summary')
+        title_cell.font = TITLE_FONT
+        ws_sum.append([title_cell])
+        ws_sum.append([f'Generated: {datetime.now().strftime("%d %b %Y %H:%M")}'])
+        ws_sum.append([])
 
-        summary_rows = [
-            ('Total rows processed', summary_data.get('total', 0)),
-            ('Additions (new in File B)', summary_data.get('additions', 0)),
-            ('Deletions (removed from File A)', summary_data.get('deletions', 0)),
-            ('Changes (modified fields)', summary_data.get('changes', 0)),
-            ('Unchanged', summary_data.get('unchanged', 0)),
-        ]
+        for label, summary_key in _SUMMARY_ROWS:
+            label_cell = WriteOnlyCell(ws_sum, value=label)
+            label_cell.fill = SUMMARY_FILL
+            label_cell.font = BOLD_FONT
+            ws_sum.append([label_cell, summary_data.get(summary_key, 0)])
 
-        for i, (label, val) in enumerate(summary_rows, start=4):
-            label_cell = ws_sum.cell(row=i, column=1, value=label)
-            ws_sum.cell(row=i, column=2, value=val)
-            label_cell.fill = _make_summary_title_fill()
-            label_cell.font = Font(bold=True)
+    _save_workbook(wb, output, compression_level)
 
-        ws_sum.column_dimensions['A'].width = 40
-        ws_sum.column_dimensions['B'].width = 15
 
-    # Serialize to bytes
+def build_comparison_report(*args: Any, **kwargs: Any) -> bytes:
+    """
+    Same arguments as write_comparison_report (minus `output`).
+
+    Returns raw bytes of the .xlsx file.
+    """
     buf = io.BytesIO()
-    wb.save(buf)
-    buf.seek(0)
-    return buf.read()
+    write_comparison_report(buf, *args, **kwargs)
+    return buf.getvalue()
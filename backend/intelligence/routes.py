@@ -10,29 +10,44 @@ import tempfile
 import threading
 import time
 import uuid
+from collections import OrderedDict
 from datetime import datetime
-from typing import Any, Dict, Optional
+from functools import lru_cache
+from typing import Any, Dict, List, Optional
 
 import pandas as pd
-from flask import Blueprint, jsonify, request, send_file
+from flask import Blueprint, current_app, jsonify, request, send_file
+from werkzeug.formparser import parse_form_data
 from extensions import limiter
 
 from .excel_analyzer import (
-    read_sheet_dual_pass, extract_values_grid, get_formula_cells,
+    read_sheet_dual_pass, extract_values_grid, extract_formula_grid, get_formula_cells,
     analyze_columns, classify_column_formulas,
     detect_header_row, extract_header_names,
 )
 from .rule_engine import (
-    ComparisonTemplate, validate_template, execute_template,
+    ComparisonTemplate, validate_template, execute_template, referenced_fields,
 )
-from .output_builder import build_comparison_report
+from .output_builder import write_comparison_report
 from .ai_assistant import (
     AIProviderFactory,
     build_nl_to_rule_prompt, build_template_suggest_prompt, build_chat_prompt,
     SYSTEM_PROMPT_NL_TO_RULE, SYSTEM_PROMPT_TEMPLATE_SUGGEST, SYSTEM_PROMPT_CHAT,
     parse_rule_from_ai, parse_template_slug,
+    response_cache,
 )
 
+try:
+    import orjson
+except ImportError:  # stdlib json parses the built-in templates instead
+    orjson = None
+
+try:
+    import python_calamine  # noqa: F401 — enables pandas' Rust-backed 'calamine' engine
+    EXCEL_READ_ENGINE: Optional[str] = 'calamine'
+except ImportError:
+    EXCEL_READ_ENGINE = None  # pandas default (openpyxl / xlrd)
+
 logger = logging.getLogger(__name__)
 
 intel_bp = Blueprint('intel', __name__, url_prefix='/api/intel')
@@ -68,6 +83,17 @@ def _compute_dup_group_labels(analysis_columns):
     return dup_names, group_map
 
 
+def _prune_columns(df: pd.DataFrame, needed: set) -> pd.DataFrame:
+    """
+    Keep only the columns in `needed` (original order). Columns whose name is still
+    duplicated are kept as-is, since dataframe_to_rows suffixes them positionally.
+    """
+    keep = df.columns.isin(needed) | df.columns.duplicated(keep=False)
+    if keep.all():
+        return df
+    return df.loc[:, keep]
+
+
 def _rename_dup_columns(df, analysis_columns, column_mapping=None):
     """
     Rename duplicate pandas columns (e.g. 'Age.1') to bracket-label names
@@ -119,86 +145,126 @@ def _rename_dup_columns(df, analysis_columns, column_mapping=None):
 
 
 # ── In-memory session store ────────────────────────────────────────────────────
-_sessions: Dict[str, Dict] = {}
+# Sessions expire SESSION_TTL_SECONDS after their last write. Expired entries are
+# evicted lazily — on lookup, and oldest-first on every write — so no sweeper thread.
+_sessions: "OrderedDict[str, Dict]" = OrderedDict()
 _sessions_lock = threading.Lock()
 SESSION_TTL_SECONDS = 3600  # 1 hour
+MAX_SESSIONS = 1024
 
 
-def _cleanup_sessions():
-    """Background thread: remove expired sessions and their temp files."""
-    while True:
-        time.sleep(300)
-        now = time.time()
-        with _sessions_lock:
-            expired = [sid for sid, s in _sessions.items()
-                       if now - s.get('created_at', 0) > SESSION_TTL_SECONDS]
-            for sid in expired:
-                session = _sessions.pop(sid, None)
-                if session:
-                    for path in session.get('temp_paths', {}).values():
-                        try:
-                            os.unlink(path)
-                        except OSError:
-                            pass
-                    result_path = session.get('result', {}).get('path')
-                    if result_path:
-                        try:
-                            os.unlink(result_path)
-                        except OSError:
-                            pass
-        if expired:
-            logger.info(f"Cleaned up {len(expired)} expired intel sessions")
-
-
-threading.Thread(target=_cleanup_sessions, daemon=True).start()
+def _is_expired(session: Dict, now: float) -> bool:
+    return now - session.get('created_at', 0) > SESSION_TTL_SECONDS
+
+
+def _discard_session_files(sessions: List[Dict]):
+    """Unlink the uploaded and report temp files of evicted sessions."""
+    for session in sessions:
+        paths = list(session.get('temp_paths', {}).values())
+        result_path = session.get('result', {}).get('path')
+        if result_path:
+            paths.append(result_path)
+        for path in paths:
+            try:
+                os.unlink(path)
+            except OSError:
+                pass
 
 
 def _get_session(session_id: str) -> Optional[Dict]:
     with _sessions_lock:
-        return _sessions.get(session_id)
+        session = _sessions.get(session_id)
+        if session is None or not _is_expired(session, time.time()):
+            return session
+        del _sessions[session_id]
+    _discard_session_files([session])
+    return None
 
 
 def _set_session(session_id: str, data: Dict):
+    now = time.time()
+    evicted = []
     with _sessions_lock:
-        _sessions[session_id] = {**data, 'created_at': time.time()}
+        _sessions[session_id] = {**data, 'created_at': now}
+        _sessions.move_to_end(session_id)
+        # Ordered by last write: expired (or over-capacity) entries sit at the front
+        for sid in _sessions:
+            if sid == session_id:
+                break
+            if len(_sessions) - len(evicted) <= MAX_SESSIONS and not _is_expired(_sessions[sid], now):
+                break
+            evicted.append(sid)
+        evicted = [_sessions.pop(sid) for sid in evicted]
+    if evicted:
+        _discard_session_files(evicted)
+        logger.info(f"Evicted {len(evicted)} intel session(s)")
 
 
 # ── Template registry ─────────────────────────────────────────────────────────
 _TEMPLATES_DIR = os.path.join(os.path.dirname(__file__), 'built_in_templates')
 
 
-def _load_builtin_templates() -> Dict[str, Dict]:
+# slug (file stem) → path. Only the directory is scanned at import; each file is
+# parsed on first use and memoized.
+_TEMPLATE_FILES: Dict[str, str] = {
+    entry.name[:-len('.json')]: entry.path
+    for entry in (os.scandir(_TEMPLATES_DIR) if os.path.isdir(_TEMPLATES_DIR) else ())
+    if entry.name.endswith('.json') and entry.is_file()
+}
+
+
+@lru_cache(maxsize=None)
+def _load_template_file(path: str) -> Optional[Dict]:
+    try:
+        with open(path, 'rb') as f:
+            raw = f.read()
+        return orjson.loads(raw) if orjson is not None else json.loads(raw)
+    except Exception as e:
+        logger.error(f"Failed to load template {os.path.basename(path)}: {e}")
+        return None
+
+
+@lru_cache(maxsize=1)
+def _builtin_templates() -> Dict[str, Dict]:
+    """Every built-in template keyed by slug (the file's "slug" field, else its stem)."""
     templates = {}
-    if not os.path.isdir(_TEMPLATES_DIR):
-        return templates
-    for fname in os.listdir(_TEMPLATES_DIR):
-        if fname.endswith('.json'):
-            path = os.path.join(_TEMPLATES_DIR, fname)
-            try:
-                with open(path, 'r', encoding='utf-8') as f:
-                    data = json.load(f)
-                    slug = data.get('slug', fname.replace('.json', ''))
-                    templates[slug] = data
-            except Exception as e:
-                logger.error(f"Failed to load template {fname}: {e}")
+    for stem, path in sorted(_TEMPLATE_FILES.items()):
+        data = _load_template_file(path)
+        if data is not None:
+            templates[data.get('slug', stem)] = data
     return templates
 
 
-_builtin_templates = _load_builtin_templates()
+def _get_builtin(slug: str) -> Optional[Dict]:
+    """One built-in template; parses only its own file when the slug matches the stem."""
+    path = _TEMPLATE_FILES.get(slug)
+    if path is not None:
+        data = _load_template_file(path)
+        if data is not None and data.get('slug', slug) == slug:
+            return data
+    return _builtin_templates().get(slug)
 
 
 # ── Helper: AI provider from request headers ──────────────────────────────────
 def _get_ai_provider_from_request():
-    """Extract AI provider from request headers (BYOK only)."""
+    """
+    Extract AI provider from request headers (BYOK only).
+    Optional X-AI-Fallback: JSON list of {"provider", "api_key", "model"} tried in
+    order when the primary provider is rate-limited or down.
+    """
     provider_name = request.headers.get('X-AI-Provider', 'anthropic').lower()
     api_key = request.headers.get('X-AI-Key', '')
     model = request.headers.get('X-AI-Model', '')
+    fallback_header = request.headers.get('X-AI-Fallback', '')
 
     if not api_key:
         return None, "No AI API key provided. Please configure an API key in AI Settings."
 
     try:
-        provider = AIProviderFactory.get_provider(provider_name, api_key, model or None)
+        fallback = json.loads(fallback_header) if fallback_header else None
+        if fallback is not None and not isinstance(fallback, list):
+            return None, "X-AI-Fallback must be a JSON list"
+        provider = AIProviderFactory.get_provider(provider_name, api_key, model or None, fallback=fallback)
         return provider, None
     except Exception as e:
         return None, str(e)
@@ -220,22 +286,17 @@ def _analyze_file(filepath: str) -> Dict:
         header_row = detect_header_row(values_grid)
         headers = extract_header_names(values_grid, header_row)
 
-        # Build per-column formula grids
-        formula_grid = []
-        for row in raw_data['rows']:
-            formula_grid.append([cell['formula'] for cell in row])
+        formula_grid = extract_formula_grid(raw_data)
 
         columns = analyze_columns(values_grid, formula_grid, header_row)
 
-        # Classify formula types per column
+        # Classify formula types per column, reading only the columns that hold formulas
+        data_rows = formula_grid[header_row + 1:]
         for col_info in columns:
             if col_info.get('formula_info') and col_info['formula_count'] > 0:
                 col_idx = col_info['index']
-                col_formulas = [
-                    formula_grid[r][col_idx] if col_idx < len(formula_grid[r]) else None
-                    for r in range(header_row + 1, len(formula_grid))
-                ]
-                formula_type = classify_column_formulas([f for f in col_formulas if f])
+                col_formulas = [r[col_idx] for r in data_rows if col_idx < len(r) and r[col_idx]]
+                formula_type = classify_column_formulas(col_formulas)
                 if col_info['formula_info']:
                     col_info['formula_info']['formula_type'] = formula_type
 
@@ -274,6 +335,12 @@ def _suggest_template_heuristic(headers: list, sheet_name: str) -> Optional[str]
     return None
 
 
+def _spool_upload_to_disk(total_content_length, content_type, filename, content_length=None):
+    """Werkzeug stream_factory: write each uploaded file part to a named temp file."""
+    suffix = os.path.splitext(filename or '')[1].lower()
+    return tempfile.NamedTemporaryFile('wb+', suffix=suffix, delete=False)
+
+
 # ── Endpoints ─────────────────────────────────────────────────────────────────
 
 @intel_bp.route('/analyze', methods=['POST'])
@@ -282,47 +349,63 @@ def analyze():
     Upload 1-2 Excel files and return column analysis.
     Returns ColumnAnalysis JSON with session_id.
     """
-    if not request.files:
+    # Parse the multipart body ourselves so each file part streams straight into
+    # its own named temp file — no spooled in-memory copy followed by f.save().
+    _, _, files = parse_form_data(
+        request.environ,
+        stream_factory=_spool_upload_to_disk,
+        max_content_length=current_app.config.get('MAX_CONTENT_LENGTH'),
+    )
+    uploads = list(files.items(multi=True))
+    for _, f in uploads:
+        f.stream.close()
+    if not uploads:
         return jsonify({'error': 'No files uploaded'}), 400
 
     session_id = str(uuid.uuid4())
     file_results = {}
     temp_paths = {}
+    kept_paths = set()
 
-    for key in ['file_a', 'file_b']:
-        f = request.files.get(key)
-        if not f:
-            continue
-        if not f.filename.lower().endswith(('.xlsx', '.xls')):
-            return jsonify({'error': f'{key}: Only .xlsx and .xls files supported'}), 400
-
-        # Save to temp
-        suffix = '.xlsx' if f.filename.lower().endswith('.xlsx') else '.xls'
-        tmp = tempfile.NamedTemporaryFile(delete=False, suffix=suffix)
-        f.save(tmp.name)
-        tmp.close()
-        temp_paths[key] = tmp.name
-
-        try:
-            file_results[key] = _analyze_file(tmp.name)
-        except Exception as e:
-            logger.error(f"Analysis failed for {key}: {e}")
-            return jsonify({'error': f'Failed to analyze {key}: {str(e)}'}), 500
-
-    if not file_results:
-        return jsonify({'error': 'No valid files provided'}), 400
-
-    # Collect original filenames for template variable resolution
-    original_names = {key: request.files[key].filename for key in ['file_a', 'file_b'] if request.files.get(key)}
-
-    # Store in session
-    _set_session(session_id, {
-        'file_analysis': file_results,
-        'temp_paths': temp_paths,
-        'original_names': original_names,
-        'template': None,
-        'result': None,
-    })
+    try:
+        for key in ['file_a', 'file_b']:
+            f = files.get(key)
+            if not f:
+                continue
+            if not f.filename.lower().endswith(('.xlsx', '.xls')):
+                return jsonify({'error': f'{key}: Only .xlsx and .xls files supported'}), 400
+
+            temp_paths[key] = f.stream.name
+
+            try:
+                file_results[key] = _analyze_file(f.stream.name)
+            except Exception as e:
+                logger.error(f"Analysis failed for {key}: {e}")
+                return jsonify({'error': f'Failed to analyze {key}: {str(e)}'}), 500
+
+        if not file_results:
+            return jsonify({'error': 'No valid files provided'}), 400
+
+        # Collect original filenames for template variable resolution
+        original_names = {key: files[key].filename for key in ['file_a', 'file_b'] if files.get(key)}
+
+        # Store in session
+        _set_session(session_id, {
+            'file_analysis': file_results,
+            'temp_paths': temp_paths,
+            'original_names': original_names,
+            'template': None,
+            'result': None,
+        })
+        kept_paths.update(temp_paths.values())
+    finally:
+        # Rejected, failed, or unrecognised parts are not owned by any session
+        for _, f in uploads:
+            if f.stream.name not in kept_paths:
+                try:
+                    os.unlink(f.stream.name)
+                except OSError:
+                    pass
 
     response = {'session_id': session_id, **file_results}
     return jsonify(response)
@@ -381,8 +464,10 @@ def process():
 
     try:
         sc = template.sheet_config
-        df_a = pd.read_excel(path_a, sheet_name=sc.file_a_sheet, header=sc.header_row)
-        df_b = pd.read_excel(path_b, sheet_name=sc.file_b_sheet or sc.file_a_sheet, header=sc.header_row)
+        df_a = pd.read_excel(path_a, sheet_name=sc.file_a_sheet, header=sc.header_row,
+                             engine=EXCEL_READ_ENGINE)
+        df_b = pd.read_excel(path_b, sheet_name=sc.file_b_sheet or sc.file_a_sheet, header=sc.header_row,
+                             engine=EXCEL_READ_ENGINE)
         # Strip whitespace from column names to match the stripped names from analysis
         df_a.columns = df_a.columns.map(lambda c: str(c).strip())
         df_b.columns = df_b.columns.map(lambda c: str(c).strip())
@@ -400,6 +485,12 @@ def process():
             df_a = _rename_dup_columns(df_a, analysis_cols_a, col_mapping)
             df_b = _rename_dup_columns(df_b, analysis_cols_a, col_mapping)  # same structure assumed
 
+        # Drop columns no key, field list, rule or label refers to — they would only be
+        # carried through every row dict. Done after the positional renames above.
+        needed = referenced_fields(template)
+        df_a = _prune_columns(df_a, needed)
+        df_b = _prune_columns(df_b, needed)
+
         result = execute_template(template, df_a, df_b)
     except Exception as e:
         logger.error(f"Process failed: {e}")
@@ -413,9 +504,13 @@ def process():
             response['warnings'] = result['warnings']
         return jsonify(response)
 
-    # Build Excel report
+    # Build Excel report straight into a temp file — the xlsx is never held in memory
+    result_id = str(uuid.uuid4())
+    tmp_report = tempfile.NamedTemporaryFile(delete=False, suffix='.xlsx')
+    tmp_report.close()
     try:
-        report_bytes = build_comparison_report(
+        write_comparison_report(
+            tmp_report.name,
             result=result,
             template_name=template.template_name,
             compare_fields=template.column_mapping.compare_fields,
@@ -429,14 +524,10 @@ def process():
             column_order=template.output_config.column_order,
         )
     except Exception as e:
+        os.unlink(tmp_report.name)
         logger.error(f"Report generation failed: {e}")
         return jsonify({'error': f'Report generation failed: {str(e)}'}), 500
 
-    # Write report to a temp file — avoids holding large bytes in memory dict
-    result_id = str(uuid.uuid4())
-    tmp_report = tempfile.NamedTemporaryFile(delete=False, suffix='.xlsx')
-    tmp_report.write(report_bytes)
-    tmp_report.close()
     session['result'] = {'id': result_id, 'path': tmp_report.name, 'summary': result['summary']}
     _set_session(session_id, session)
 
@@ -485,6 +576,9 @@ def download(session_id, result_id):
         mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
         as_attachment=True,
         download_name=filename,
+        conditional=True,  # ETag / Range support for large reports
+        etag=True,
+        max_age=0,  # always revalidate — a refresh gets a 304 instead of the full file
     )
 
 
@@ -492,7 +586,7 @@ def download(session_id, result_id):
 def list_templates():
     """List all available built-in and user templates."""
     templates = []
-    for slug, tmpl in _builtin_templates.items():
+    for slug, tmpl in _builtin_templates().items():
         templates.append({
             'slug': slug,
             'name': tmpl.get('template_name', slug),
@@ -505,8 +599,9 @@ def list_templates():
 @intel_bp.route('/templates/<slug>', methods=['GET'])
 def get_template(slug):
     """Get a specific template by slug."""
-    if slug in _builtin_templates:
-        return jsonify(_builtin_templates[slug])
+    builtin = _get_builtin(slug)
+    if builtin is not None:
+        return jsonify(builtin)
     # Check session-scoped user templates
     session_id = request.args.get('session_id')
     if session_id:
@@ -564,9 +659,17 @@ def ai_suggest():
         return jsonify({'suggested_template': heuristic_slug, 'confidence': 'heuristic'})
 
     try:
+        # Keyed on the exact prompt sent, so only identical requests share an answer
         user_prompt = build_template_suggest_prompt(columns, sheet_name)
-        ai_response = provider.complete(SYSTEM_PROMPT_TEMPLATE_SUGGEST, user_prompt, max_tokens=20)
-        ai_slug = parse_template_slug(ai_response)
+        cache_key = response_cache.make_key(
+            type(provider).__name__, getattr(provider, 'model', ''),
+            SYSTEM_PROMPT_TEMPLATE_SUGGEST, user_prompt,
+        )
+        ai_slug = response_cache.get(cache_key)
+        if ai_slug is None:
+            ai_response = provider.complete(SYSTEM_PROMPT_TEMPLATE_SUGGEST, user_prompt, max_tokens=20)
+            ai_slug = parse_template_slug(ai_response)
+            response_cache.set(cache_key, ai_slug)
         slug = ai_slug if ai_slug != 'none' else heuristic_slug
     except Exception as e:
         logger.warning(f"AI template suggestion failed: {e}, using heuristic")
@@ -575,6 +678,16 @@ def ai_suggest():
     return jsonify({'suggested_template': slug, 'confidence': 'ai' if provider else 'heuristic'})
 
 
+MAX_NL_TO_RULE_BATCH = 10
+
+
+def _nl_to_rule_cache_key(provider, user_prompt: str) -> str:
+    return response_cache.make_key(
+        type(provider).__name__, getattr(provider, 'model', ''),
+        SYSTEM_PROMPT_NL_TO_RULE, user_prompt,
+    )
+
+
 @intel_bp.route('/ai/nl-to-rule', methods=['POST'])
 @limiter.limit("20 per minute;100 per day")
 def nl_to_rule():
@@ -592,16 +705,76 @@ def nl_to_rule():
 
     try:
         user_prompt = build_nl_to_rule_prompt(description, columns)
-        ai_response = provider.complete(SYSTEM_PROMPT_NL_TO_RULE, user_prompt, max_tokens=512)
-        rule, parse_err = parse_rule_from_ai(ai_response)
-        if parse_err:
-            return jsonify({'error': parse_err}), 422
+        cache_key = _nl_to_rule_cache_key(provider, user_prompt)
+        rule = response_cache.get(cache_key)
+        if rule is None:
+            ai_response = provider.complete(SYSTEM_PROMPT_NL_TO_RULE, user_prompt, max_tokens=512)
+            rule, parse_err = parse_rule_from_ai(ai_response)
+            if parse_err:
+                return jsonify({'error': parse_err}), 422
+            response_cache.set(cache_key, rule)
         return jsonify({'rule': rule})
     except Exception as e:
         logger.error(f"NL-to-rule failed: {e}")
         return jsonify({'error': f'AI request failed: {str(e)}'}), 500
 
 
+@intel_bp.route('/ai/nl-to-rules', methods=['POST'])
+@limiter.limit("10 per minute;50 per day")
+def nl_to_rules():
+    """
+    Convert several natural language descriptions to rule cards in one call.
+    Uncached descriptions are sent to the provider concurrently.
+
+    Body: { descriptions: [str, ...], columns: [...] }
+    Returns: { results: [{rule} | {error}, ...] } in input order.
+    """
+    body = request.get_json() or {}
+    descriptions = body.get('descriptions')
+    columns = body.get('columns', [])
+
+    if not isinstance(descriptions, list) or not descriptions:
+        return jsonify({'error': 'descriptions (non-empty list) is required'}), 400
+    if len(descriptions) > MAX_NL_TO_RULE_BATCH:
+        return jsonify({'error': f'At most {MAX_NL_TO_RULE_BATCH} descriptions per request'}), 400
+
+    provider, err = _get_ai_provider_from_request()
+    if err or not provider:
+        return jsonify({'error': err or 'AI provider not configured'}), 503
+
+    results = [None] * len(descriptions)
+    pending = []  # (position, user_prompt, cache_key) for cache misses
+    for i, description in enumerate(descriptions):
+        description = str(description or '').strip()
+        if not description:
+            results[i] = {'error': 'description is required'}
+            continue
+        user_prompt = build_nl_to_rule_prompt(description, columns)
+        cache_key = _nl_to_rule_cache_key(provider, user_prompt)
+        rule = response_cache.get(cache_key)
+        if rule is not None:
+            results[i] = {'rule': rule}
+        else:
+            pending.append((i, user_prompt, cache_key))
+
+    responses = provider.complete_batch(
+        SYSTEM_PROMPT_NL_TO_RULE, [p[1] for p in pending], max_tokens=512,
+    )
+    for (i, _, cache_key), ai_response in zip(pending, responses):
+        if isinstance(ai_response, Exception):
+            logger.error(f"NL-to-rule batch item failed: {ai_response}")
+            results[i] = {'error': f'AI request failed: {str(ai_response)}'}
+            continue
+        rule, parse_err = parse_rule_from_ai(ai_response)
+        if parse_err:
+            results[i] = {'error': parse_err}
+            continue
+        response_cache.set(cache_key, rule)
+        results[i] = {'rule': rule}
+
+    return jsonify({'results': results})
+
+
 @intel_bp.route('/ai/chat', methods=['POST'])
 @limiter.limit("30 per minute;200 per day")
 def ai_chat():
@@ -4,14 +4,17 @@ from .rule_schema import (
     RowMatchConfig, FormulaRuleConfig,
 )
 from .rule_validator import validate_rule, validate_template
-from .row_matcher import exact_match, fuzzy_match, make_key
-from .change_detector import fields_changed, evaluate_conditions, resolve_outcome_label
-from .rule_executor import execute_template, dataframe_to_rows
+from .row_matcher import exact_match, fuzzy_match, make_key, make_keys_vectorized
+from .change_detector import (
+    fields_changed, fields_changed_vectorized, evaluate_conditions, resolve_outcome_label,
+    compile_condition_rule,
+)
+from .rule_executor import execute_template, dataframe_to_rows, referenced_fields
 
 __all__ = [
     'ComparisonTemplate', 'Rule', 'SheetConfig', 'ColumnMapping', 'OutputConfig',
     'validate_rule', 'validate_template',
     'exact_match', 'fuzzy_match',
-    'fields_changed', 'evaluate_conditions',
-    'execute_template', 'dataframe_to_rows',
+    'fields_changed', 'fields_changed_vectorized', 'evaluate_conditions',
+    'execute_template', 'dataframe_to_rows', 'referenced_fields',
 ]
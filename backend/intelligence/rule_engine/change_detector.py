@@ -4,7 +4,15 @@ Per-field difference detection with type-aware comparison.
 import math
 import re
 from datetime import datetime, date
-from typing import Any, Dict, List, Optional, Tuple
+from functools import lru_cache
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+
+# {field_name} placeholders in outcome labels
+_OUTCOME_RE = re.compile(r'\{(\w[\w\s]*)\}')
 
 
 def _normalize(val: Any) -> str:
@@ -36,83 +44,198 @@ def fields_changed(row_a: Dict, row_b: Dict, fields: List[str]) -> List[str]:
     return changed
 
 
-def evaluate_condition(row_a: Optional[Dict], row_b: Optional[Dict],
-                       condition: Dict) -> bool:
+def _normalize_float(val: Any) -> str:
+    # val != val is the NaN test without a math.isnan call
+    if val is None or val != val or val in (math.inf, -math.inf):
+        return ''
+    if val == int(val):
+        return str(int(val))
+    return str(val)
+
+
+def _normalize_datetime(val: Any) -> str:
+    if val is None or val is pd.NaT:
+        return ''
+    return val.strftime('%Y-%m-%d')
+
+
+def make_normalizer(dtype: np.dtype) -> Callable[[Any], str]:
     """
-    Evaluate a single condition against matched row pair (row_a, row_b).
-    For PRESENCE_RULE context, one of row_a/row_b may be None.
+    Return a _normalize equivalent specialized for cells of a single pandas dtype
+    (as produced by Series.tolist()), skipping the per-cell isinstance dispatch.
+    Object and unrecognised dtypes fall back to the generic _normalize.
     """
-    field = condition['field']
-    operator = condition['operator']
-    cond_value = condition.get('value')
+    kind = getattr(dtype, 'kind', 'O')
+    if kind == 'f':
+        return _normalize_float
+    if kind in 'iub':
+        return str
+    if kind == 'M':
+        return _normalize_datetime
+    return _normalize
+
 
-    # Use row_b if available (newer state), else row_a
-    current_row = row_b if row_b is not None else row_a
-    prev_row = row_a
+def _normalize_column(df: pd.DataFrame, field: str) -> np.ndarray:
+    """
+    Normalize every cell of `field` once, as _normalize would see it in the row dicts
+    (nulls become None → ''). A missing field normalizes to '' throughout.
+    """
+    if field not in df.columns:
+        return np.full(len(df), '', dtype=object)
+    col = df[field]
+    if isinstance(col, pd.DataFrame):
+        # Names still repeated after suffixing (e.g. X, X, X__1): dict(zip(...)) in
+        # dataframe_to_rows keeps the last occurrence's values under this name
+        col = col.iloc[:, -1]
+    if col.dtype.kind == 'M':
+        return col.dt.strftime('%Y-%m-%d').fillna('').to_numpy(dtype=object)
+    if pd.api.types.infer_dtype(col, skipna=True) == 'string':
+        # Text columns (status, entity, clinic…) repeat a handful of values: normalize
+        # each distinct string once and broadcast it back through the codes. Only pure
+        # str columns qualify — factorize would merge e.g. True with 1.
+        codes, uniques = pd.factorize(col)
+        normalized = np.array([_normalize(u) for u in uniques] + [''], dtype=object)
+        return normalized[codes]  # code -1 (null) picks the trailing ''
+    normalize = make_normalizer(col.dtype)
+    values = col.tolist()
+    nulls = col.isna().tolist()
+    return np.array(['' if null else normalize(v) for v, null in zip(values, nulls)], dtype=object)
 
-    current_val = current_row.get(field) if current_row else None
-    prev_val = prev_row.get(field) if prev_row else None
 
-    if operator == 'is_empty':
-        return _is_empty(current_val)
+def fields_changed_vectorized(df_a: pd.DataFrame, df_b: pd.DataFrame,
+                              pair_idx: np.ndarray, fields: List[str]) -> List[List[str]]:
+    """
+    fields_changed for many matched pairs at once.
 
-    if operator == 'is_not_empty':
-        return not _is_empty(current_val)
+    pair_idx is an (n_pairs, 2) array of positional (idx_a, idx_b) rows. Each field is
+    normalized once per cell and compared column-wise; returns the changed field names
+    per pair, in `fields` order.
+    """
+    n_pairs = len(pair_idx)
+    if not n_pairs or not fields:
+        return [[] for _ in range(n_pairs)]
 
-    if operator == 'equals':
-        return _normalize(current_val) == _normalize(cond_value)
+    idx_a = pair_idx[:, 0]
+    idx_b = pair_idx[:, 1]
+    diff = np.empty((n_pairs, len(fields)), dtype=bool)
+    for k, f in enumerate(fields):
+        diff[:, k] = _normalize_column(df_a, f)[idx_a] != _normalize_column(df_b, f)[idx_b]
 
-    if operator == 'not_equals':
-        return _normalize(current_val) != _normalize(cond_value)
+    changed: List[List[str]] = [[] for _ in range(n_pairs)]
+    for row, k in zip(*np.nonzero(diff)):
+        changed[row].append(fields[k])
+    return changed
 
-    if operator == 'contains':
-        return str(cond_value).lower() in str(current_val or '').lower()
 
-    if operator == 'starts_with':
-        return str(current_val or '').lower().startswith(str(cond_value).lower())
+# (current value, previous value) → bool, for one condition with its operand bound
+ConditionPredicate = Callable[[Any, Any], bool]
 
-    if operator == 'changed_from_empty':
-        return _is_empty(prev_val) and not _is_empty(current_val)
 
-    if operator == 'changed_to_empty':
-        return not _is_empty(prev_val) and _is_empty(current_val)
+def _date_predicate(cond_value: Any, before: bool) -> ConditionPredicate:
+    dt_compare = _parse_date(cond_value)
 
-    if operator == 'date_is_before':
+    def predicate(cur, prev):
+        if not dt_compare:
+            return False
         try:
-            dt_current = _parse_date(current_val)
-            dt_compare = _parse_date(cond_value)
-            if dt_current and dt_compare:
-                return dt_current < dt_compare
+            dt_current = _parse_date(cur)
+            if dt_current:
+                return dt_current < dt_compare if before else dt_current > dt_compare
         except Exception:
             pass
         return False
+    return predicate
+
+
+def _make_predicate(condition: Dict) -> Optional[ConditionPredicate]:
+    """
+    Bind one condition's operator and operand into a predicate (operand prepared once).
+    Returns None for an unknown operator.
+    """
+    op = condition['operator']
+    value = condition.get('value')
 
-    if operator == 'date_is_after':
+    if op == 'is_empty':
+        return lambda cur, prev: _is_empty(cur)
+    if op == 'is_not_empty':
+        return lambda cur, prev: not _is_empty(cur)
+    if op in ('equals', 'not_equals'):
+        target = _normalize(value)
+        if op == 'equals':
+            return lambda cur, prev: _normalize(cur) == target
+        return lambda cur, prev: _normalize(cur) != target
+    if op == 'contains':
+        needle = str(value).lower()
+        return lambda cur, prev: needle in str(cur or '').lower()
+    if op == 'starts_with':
+        prefix = str(value).lower()
+        return lambda cur, prev: str(cur or '').lower().startswith(prefix)
+    if op == 'changed_from_empty':
+        return lambda cur, prev: _is_empty(prev) and not _is_empty(cur)
+    if op == 'changed_to_empty':
+        return lambda cur, prev: not _is_empty(prev) and _is_empty(cur)
+    if op in ('date_is_before', 'date_is_after'):
+        return _date_predicate(value, before=op == 'date_is_before')
+    if op in ('changed_from_pattern', 'changed_to_pattern'):
         try:
-            dt_current = _parse_date(current_val)
-            dt_compare = _parse_date(cond_value)
-            if dt_current and dt_compare:
-                return dt_current > dt_compare
-        except Exception:
-            pass
-        return False
+            search = re.compile(str(value), re.IGNORECASE).search
+        except re.error:
+            # Invalid pattern: raise re.error when a row is evaluated, not at prep time
+            pattern_text = str(value)
+
+            def search(text):
+                return re.search(pattern_text, text, re.IGNORECASE)
+        if op == 'changed_from_pattern':
+            return lambda cur, prev: search(str(prev or '')) is not None
+        return lambda cur, prev: search(str(cur or '')) is not None
+    return None
+
+
+def _never(cur: Any, prev: Any) -> bool:
+    return False  # unknown operator never matches
 
-    if operator == 'changed_from_pattern':
-        return bool(re.search(str(cond_value), str(prev_val or ''), re.IGNORECASE))
 
-    if operator == 'changed_to_pattern':
-        return bool(re.search(str(cond_value), str(current_val or ''), re.IGNORECASE))
+def compile_condition_rule(conditions: List[Dict],
+                           join: str = 'AND') -> Callable[[Optional[Dict], Optional[Dict]], bool]:
+    """
+    Compile a CONDITION_RULE's conditions into one matcher(row_a, row_b) → bool.
+    Operator dispatch, operand normalization and regex compilation happen here, once,
+    instead of per row. The current value comes from row_b when present (newer state),
+    else row_a; the previous value from row_a. Either row may be None.
+    """
+    bound = []
+    for condition in conditions:
+        predicate = _make_predicate(condition)
+        if predicate is None:
+            bound.append((None, _never))
+        else:
+            bound.append((condition['field'], predicate))
+    combine = all if join == 'AND' else any
+
+    def matches(row_a: Optional[Dict], row_b: Optional[Dict]) -> bool:
+        current_row = (row_b if row_b is not None else row_a) or {}
+        prev_row = row_a or {}
+        return combine(predicate(current_row.get(field), prev_row.get(field))
+                       for field, predicate in bound)
+    return matches
 
-    return False
+
+def evaluate_condition(row_a: Optional[Dict], row_b: Optional[Dict],
+                       condition: Dict) -> bool:
+    """
+    Evaluate a single condition against matched row pair (row_a, row_b).
+    For PRESENCE_RULE context, one of row_a/row_b may be None.
+    """
+    return compile_condition_rule([condition])(row_a, row_b)
 
 
 def evaluate_conditions(row_a: Optional[Dict], row_b: Optional[Dict],
                         conditions: List[Dict], join: str = 'AND') -> bool:
-    """Evaluate a list of conditions with AND/OR joining."""
-    results = [evaluate_condition(row_a, row_b, c) for c in conditions]
-    if join == 'AND':
-        return all(results)
-    return any(results)
+    """Evaluate a list of conditions with AND/OR joining (see compile_condition_rule)."""
+    return compile_condition_rule(conditions, join)(row_a, row_b)
+
+
+_DATE_FORMATS = ('%d/%m/%Y', '%Y-%m-%d', '%d-%m-%Y', '%m/%d/%Y', '%d %b %Y')
 
 
 def _parse_date(val: Any) -> Optional[datetime]:
@@ -121,18 +244,36 @@ def _parse_date(val: Any) -> Optional[datetime]:
     if isinstance(val, date):
         return datetime(val.year, val.month, val.day)
     if isinstance(val, str) and val.strip():
-        for fmt in ('%d/%m/%Y', '%Y-%m-%d', '%d-%m-%Y', '%m/%d/%Y', '%d %b %Y'):
-            try:
-                return datetime.strptime(val.strip(), fmt)
-            except ValueError:
-                continue
+        return _parse_date_str(val.strip())
     return None
 
 
+@lru_cache(maxsize=4096)
+def _parse_date_str(text: str) -> Optional[datetime]:
+    """Try each format in order; memoized since columns repeat the same date strings."""
+    for fmt in _DATE_FORMATS:
+        try:
+            return datetime.strptime(text, fmt)
+        except ValueError:
+            continue
+    return None
+
+
+@lru_cache(maxsize=256)
+def _label_parts(label_template: str) -> Tuple[str, ...]:
+    """Split a label into literal text with {field} names at the odd positions."""
+    return tuple(_OUTCOME_RE.split(label_template))
+
+
 def resolve_outcome_label(label_template: str, row: Dict) -> str:
     """Replace {field_name} placeholders in outcome labels with row values."""
-    def replacer(match):
-        field = match.group(1)
-        val = row.get(field, '')
-        return str(val) if val is not None else ''
-    return re.sub(r'\{(\w[\w\s]*)\}', replacer, label_template)
+    if '{' not in label_template:
+        return label_template  # static label (the common case)
+    parts = _label_parts(label_template)
+    if len(parts) == 1:
+        return label_template
+    resolved = list(parts)
+    for k in range(1, len(parts), 2):
+        val = row.get(parts[k], '')
+        resolved[k] = str(val) if val is not None else ''
+    return ''.join(resolved)
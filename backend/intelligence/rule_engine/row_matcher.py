@@ -1,14 +1,33 @@
 """
-Row matching: exact key matching and fuzzy matching via difflib.
+Row matching: exact key matching and fuzzy matching via RapidFuzz (difflib fallback).
 """
+import bisect
 import difflib
 import logging
+import sys
 from typing import Any, Dict, List, Optional, Tuple
 
+import numpy as np
+import pandas as pd
+
+try:
+    from rapidfuzz import fuzz, process
+except ImportError:  # fall back to difflib.SequenceMatcher
+    fuzz = process = None
+
+try:
+    from scipy.optimize import linear_sum_assignment
+except ImportError:  # assignment='optimal' falls back to greedy matching
+    linear_sum_assignment = None
+
 logger = logging.getLogger(__name__)
 
-# Fuzzy match is O(n²) — cap to avoid hanging on large datasets
+# Fuzzy match is O(n²) — cap to avoid hanging on large datasets. RapidFuzz scores
+# in native code, so it can take larger files than the pure-Python difflib fallback.
 FUZZY_ROW_LIMIT = 2000
+RAPIDFUZZ_ROW_LIMIT = 10000
+# A rows scored per cdist call: bounds the score matrix to this many rows × n_b
+_SCORE_BLOCK_ROWS = 512
 
 
 def make_key(row: Dict, key_fields: List[str]) -> str:
@@ -20,15 +39,42 @@ def make_key(row: Dict, key_fields: List[str]) -> str:
     return '|'.join(parts)
 
 
-def build_key_index(rows: List[Dict], key_fields: List[str]) -> Tuple[Dict[str, int], int]:
+def make_keys_vectorized(df: pd.DataFrame, key_fields: List[str]) -> np.ndarray:
+    """
+    make_key for every row of `df` at once (nulls and missing fields become '').
+    Each field is stringified, stripped and lower-cased as a whole column, then the
+    parts are joined with '|'.
+    """
+    parts = []
+    for field in key_fields:
+        if field not in df.columns:
+            parts.append(pd.Series('', index=df.index, dtype=object))
+            continue
+        col = df[field]
+        if isinstance(col, pd.DataFrame):
+            # Names still repeated after suffixing (e.g. X, X, X__1): dict(zip(...)) in
+            # dataframe_to_rows keeps the last occurrence's values under this name
+            col = col.iloc[:, -1]
+        # Object dtype keeps str() of the original Python values (e.g. Timestamp, float)
+        col = col.astype(object).where(col.notna(), '')
+        parts.append(col.astype(str).str.strip().str.lower())
+    if not parts:
+        return np.full(len(df), '', dtype=object)
+    return parts[0].str.cat(parts[1:], sep='|').to_numpy(dtype=object)
+
+
+def build_key_index(rows: List[Dict], key_fields: List[str],
+                    keys: Optional[np.ndarray] = None) -> Tuple[Dict[str, int], int]:
     """
     Return (index, duplicate_count) where index maps composite key → first row index.
     Duplicate keys are counted and logged; subsequent occurrences are silently skipped.
+    `keys` (from make_keys_vectorized) skips building the keys from `rows`.
     """
+    if keys is None:
+        keys = [make_key(row, key_fields) for row in rows]
     index = {}
     duplicates = 0
-    for i, row in enumerate(rows):
-        key = make_key(row, key_fields)
+    for i, key in enumerate(keys):
         if key in index:
             duplicates += 1
         else:
@@ -39,9 +85,12 @@ def build_key_index(rows: List[Dict], key_fields: List[str]) -> Tuple[Dict[str,
 
 
 def exact_match(rows_a: List[Dict], rows_b: List[Dict],
-                key_fields: List[str]) -> Tuple[List[Tuple], List[int], List[int], Dict]:
+                key_fields: List[str],
+                keys_a: Optional[np.ndarray] = None,
+                keys_b: Optional[np.ndarray] = None) -> Tuple[List[Tuple], List[int], List[int], Dict]:
     """
     Exact key match between two row lists.
+    keys_a / keys_b are optional precomputed keys (see make_keys_vectorized).
 
     Returns:
         matched_pairs: List of (idx_a, idx_b) tuples
@@ -49,8 +98,26 @@ def exact_match(rows_a: List[Dict], rows_b: List[Dict],
         only_in_b: List of row indices from rows_b with no match in rows_a
         warnings: Dict with optional duplicate_keys_a / duplicate_keys_b counts
     """
-    index_b, dups_b = build_key_index(rows_b, key_fields)
-    index_a, dups_a = build_key_index(rows_a, key_fields)
+    if keys_a is None:
+        keys_a = [make_key(row, key_fields) for row in rows_a]
+    if keys_b is None:
+        keys_b = [make_key(row, key_fields) for row in rows_b]
+    keys_a = np.asarray(keys_a, dtype=object)
+    keys_b = np.asarray(keys_b, dtype=object)
+
+    # One hash pass over both sides: every key becomes an integer code shared by A and B,
+    # and the rest of the join is integer array work
+    n_a = len(keys_a)
+    codes, uniques = pd.factorize(np.concatenate([keys_a, keys_b]))
+    codes_a, codes_b = codes[:n_a], codes[n_a:]
+
+    # Only the first occurrence of a key is matchable (same as build_key_index)
+    dup_mask_b = pd.Series(codes_b).duplicated().to_numpy()
+    dups_b = int(dup_mask_b.sum())
+    dups_a = n_a - int(np.count_nonzero(np.bincount(codes_a, minlength=len(uniques))))
+    for dups in (dups_b, dups_a):
+        if dups:
+            logger.warning(f"Detected {dups} duplicate key(s) — only first occurrence per key is matched")
 
     warnings = {}
     if dups_a:
@@ -58,81 +125,178 @@ def exact_match(rows_a: List[Dict], rows_b: List[Dict],
     if dups_b:
         warnings['duplicate_keys_b'] = dups_b
 
-    matched_pairs = []
-    matched_b_indices = set()
-    matched_a_indices = set()
+    # code → position of its first B row (-1 = key absent from B)
+    first_b_pos = np.full(len(uniques), -1, dtype=np.intp)
+    first_b = np.flatnonzero(~dup_mask_b)
+    first_b_pos[codes_b[first_b]] = first_b
+    mapped = first_b_pos[codes_a]
+    hit = mapped >= 0
+    match_a = np.flatnonzero(hit)
+    match_b = mapped[hit]
+    matched_pairs = list(zip(match_a.tolist(), match_b.tolist()))
 
-    for i, row in enumerate(rows_a):
-        key = make_key(row, key_fields)
-        if key in index_b:
-            j = index_b[key]
-            matched_pairs.append((i, j))
-            matched_b_indices.add(j)
-            matched_a_indices.add(i)
-
-    only_in_a = [i for i in range(len(rows_a)) if i not in matched_a_indices]
-    only_in_b = [j for j in range(len(rows_b))
-                 if j not in matched_b_indices]
+    matched_b_mask = np.zeros(len(keys_b), dtype=bool)
+    matched_b_mask[match_b] = True
+    only_in_a = np.flatnonzero(~hit).tolist()
+    only_in_b = np.flatnonzero(~matched_b_mask).tolist()
 
     return matched_pairs, only_in_a, only_in_b, warnings
 
 
-def fuzzy_match(rows_a: List[Dict], rows_b: List[Dict],
-                key_fields: List[str],
-                threshold: float = 0.8) -> Tuple[List[Tuple], List[int], List[int], Dict]:
+def _length_band(len_a: int, threshold: float,
+                 by_length: List[int], sorted_lengths: List[int]) -> List[int]:
     """
-    Fuzzy key match using difflib.SequenceMatcher.
-
-    For each row in A, finds the best match in B above `threshold`.
-    Uses greedy matching (first-best, no global optimization).
-
-    Raises ValueError if either dataset exceeds FUZZY_ROW_LIMIT to prevent O(n²) hangs.
-
-    Returns same structure as exact_match (with warnings dict).
+    B positions (ascending) whose key length can still score above `threshold`
+    against a key of length `len_a`. ratio() is 2·matches / (len_a + len_b), which
+    is at most 2·min / (len_a + len_b) — so lengths outside the band can never pass.
     """
-    warnings = {}
+    if threshold <= 0:
+        return sorted(by_length)
+    lo = bisect.bisect_left(sorted_lengths, len_a * threshold / (2 - threshold))
+    hi = bisect.bisect_right(sorted_lengths, len_a * (2 - threshold) / threshold)
+    # Ascending positions keep the first-best tie-breaking of a full scan
+    return sorted(by_length[lo:hi])
 
-    if len(rows_a) > FUZZY_ROW_LIMIT or len(rows_b) > FUZZY_ROW_LIMIT:
-        raise ValueError(
-            f"Fuzzy matching is limited to {FUZZY_ROW_LIMIT} rows per file to prevent timeout "
-            f"(File A: {len(rows_a)} rows, File B: {len(rows_b)} rows). "
-            f"Use exact matching for larger datasets."
-        )
 
-    keys_a = [make_key(row, key_fields) for row in rows_a]
-    keys_b = [make_key(row, key_fields) for row in rows_b]
+def _greedy_pairs(keys_a: List[str], keys_b: List[str], threshold: float) -> List[Tuple[int, int]]:
+    """
+    Greedy assignment: each A key in order takes an unused exact match, else the best
+    unused B key scoring above `threshold` (first wins on ties).
+    """
     keys_b_index = {key: j for j, key in enumerate(keys_b)}
 
     matched_pairs = []
-    used_b = set()
+    used_b = np.zeros(len(keys_b), dtype=bool)
+    # Similarity of one block of A rows against all of B (0–100 scale), scored on the
+    # first fuzzy need within that block; scores[0] is A row scores_start
+    scores: Optional[np.ndarray] = None
+    scores_start = -1
+    # difflib path only: B positions ordered by key length, for the length band, and
+    # one matcher per B key so its b-side index (b2j, fullbcount) is built only once
+    by_length: Optional[List[int]] = None
+    sorted_lengths: List[int] = []
+    matchers_b: List[difflib.SequenceMatcher] = []
 
     for i, key_a in enumerate(keys_a):
         # Try exact first via O(1) lookup
         j = keys_b_index.get(key_a)
-        if j is not None and j not in used_b:
+        if j is not None and not used_b[j]:
             matched_pairs.append((i, j))
-            used_b.add(j)
+            used_b[j] = True
             continue
 
-        # Fuzzy fallback
-        best_score = threshold
-        best_j = None
-        for j, key_b in enumerate(keys_b):
-            if j in used_b:
-                continue
-            score = difflib.SequenceMatcher(None, key_a, key_b).ratio()
-            if score > best_score:
-                best_score = score
-                best_j = j
+        # Fuzzy fallback: best unused B key scoring above threshold (first wins on ties)
+        if process is not None:
+            block_start = i - i % _SCORE_BLOCK_ROWS
+            if block_start != scores_start:
+                scores = process.cdist(keys_a[block_start:block_start + _SCORE_BLOCK_ROWS], keys_b,
+                                       scorer=fuzz.ratio, score_cutoff=threshold * 100, workers=-1)
+                scores_start = block_start
+            row_scores = np.where(used_b, -1.0, scores[i - scores_start])
+            best_j = int(np.argmax(row_scores)) if len(keys_b) else None
+            if best_j is None or row_scores[best_j] <= threshold * 100:
+                best_j = None
+        else:
+            if by_length is None:
+                by_length = sorted(range(len(keys_b)), key=lambda j: len(keys_b[j]))
+                sorted_lengths = [len(keys_b[j]) for j in by_length]
+                matchers_b = [difflib.SequenceMatcher(None, '', key_b) for key_b in keys_b]
+            best_score = threshold
+            best_j = None
+            for j in _length_band(len(key_a), threshold, by_length, sorted_lengths):
+                if used_b[j]:
+                    continue
+                matcher = matchers_b[j]
+                matcher.set_seq1(key_a)
+                # quick_ratio() is a cheap upper bound on ratio(): skip the full
+                # longest-match search when it cannot beat the current best
+                if matcher.quick_ratio() <= best_score:
+                    continue
+                score = matcher.ratio()
+                if score > best_score:
+                    best_score = score
+                    best_j = j
 
         if best_j is not None:
             matched_pairs.append((i, best_j))
-            used_b.add(best_j)
+            used_b[best_j] = True
+
+    return matched_pairs
+
+
+def _optimal_pairs(keys_a: List[str], keys_b: List[str], threshold: float) -> List[Tuple[int, int]]:
+    """
+    Optimal assignment: the one-to-one pairing with the highest total ratio score
+    (SciPy's linear_sum_assignment over the full RapidFuzz score matrix), keeping
+    only pairs scoring above `threshold`. Pairs are returned in A order.
+    """
+    if not keys_a or not keys_b:
+        return []
+    cutoff = threshold * 100
+    scores = process.cdist(keys_a, keys_b, scorer=fuzz.ratio, score_cutoff=cutoff, workers=-1)
+    rows, cols = linear_sum_assignment(scores, maximize=True)
+    keep = scores[rows, cols] > cutoff
+    return list(zip(rows[keep].tolist(), cols[keep].tolist()))
+
+
+def fuzzy_match(rows_a: List[Dict], rows_b: List[Dict],
+                key_fields: List[str],
+                threshold: float = 0.8,
+                keys_a: Optional[np.ndarray] = None,
+                keys_b: Optional[np.ndarray] = None,
+                assignment: str = 'greedy') -> Tuple[List[Tuple], List[int], List[int], Dict]:
+    """
+    Fuzzy key match using RapidFuzz's ratio (normalized Indel similarity, scored for
+    all key pairs in one native cdist call), or difflib.SequenceMatcher when RapidFuzz
+    is not installed.
+
+    assignment='greedy' (default): for each row in A, takes the best unused match in B
+    above `threshold` (first-best, no global optimization).
+    assignment='optimal': pairs rows to maximize the total score (needs RapidFuzz and
+    SciPy; falls back to greedy with a warning when either is missing).
+
+    Raises ValueError if either dataset exceeds the row limit (RAPIDFUZZ_ROW_LIMIT for
+    greedy RapidFuzz matching, else FUZZY_ROW_LIMIT) to prevent O(n²) hangs.
+
+    keys_a / keys_b are optional precomputed keys (see make_keys_vectorized).
+
+    Returns same structure as exact_match (with warnings dict).
+    """
+    warnings = {}
+
+    optimal = assignment == 'optimal'
+    if optimal and (process is None or linear_sum_assignment is None):
+        logger.warning("Optimal fuzzy assignment needs RapidFuzz and SciPy — falling back to greedy matching")
+        optimal = False
+
+    # The optimal solver needs the full score matrix and is cubic, so it keeps the low cap
+    row_limit = RAPIDFUZZ_ROW_LIMIT if process is not None and not optimal else FUZZY_ROW_LIMIT
+    if len(rows_a) > row_limit or len(rows_b) > row_limit:
+        raise ValueError(
+            f"Fuzzy matching is limited to {row_limit} rows per file to prevent timeout "
+            f"(File A: {len(rows_a)} rows, File B: {len(rows_b)} rows). "
+            f"Use exact matching for larger datasets."
+        )
+
+    if keys_a is None:
+        keys_a = [make_key(row, key_fields) for row in rows_a]
+    if keys_b is None:
+        keys_b = [make_key(row, key_fields) for row in rows_b]
+    # Interned keys share identity across A and B, so the exact-match dict probes in
+    # the greedy pass succeed on a pointer compare before any string comparison
+    keys_a = [sys.intern(k) for k in keys_a]
+    keys_b = [sys.intern(k) for k in keys_b]
 
-    matched_a = {p[0] for p in matched_pairs}
-    matched_b = {p[1] for p in matched_pairs}
+    if optimal:
+        matched_pairs = _optimal_pairs(keys_a, keys_b, threshold)
+    else:
+        matched_pairs = _greedy_pairs(keys_a, keys_b, threshold)
 
-    only_in_a = [i for i in range(len(rows_a)) if i not in matched_a]
-    only_in_b = [j for j in range(len(rows_b)) if j not in matched_b]
+    used_a = np.zeros(len(keys_a), dtype=bool)
+    used_b = np.zeros(len(keys_b), dtype=bool)
+    used_a[[i for i, _ in matched_pairs]] = True
+    used_b[[j for _, j in matched_pairs]] = True
+    only_in_a = np.flatnonzero(~used_a).tolist()
+    only_in_b = np.flatnonzero(~used_b).tolist()
 
     return matched_pairs, only_in_a, only_in_b, warnings
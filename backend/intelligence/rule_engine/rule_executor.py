@@ -2,33 +2,85 @@
 Orchestrates rule execution against two DataFrames to produce a comparison result.
 Supports multi-column output: each rule can target a named output column.
 """
+import numpy as np
 import pandas as pd
-from typing import Any, Dict, List, Optional, Tuple
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
 
 from .rule_schema import ComparisonTemplate
-from .row_matcher import exact_match, fuzzy_match
+from .row_matcher import exact_match, fuzzy_match, make_keys_vectorized
 from .change_detector import (
-    fields_changed, evaluate_conditions, resolve_outcome_label, _is_empty
+    fields_changed, fields_changed_vectorized, resolve_outcome_label,
+    compile_condition_rule, _is_empty, _OUTCOME_RE
 )
 
 
+def _dedup_column_names(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Suffix repeated column names positionally (X, X__1, X__2, ...) so no column is
+    silently dropped — e.g. if _rename_dup_columns couldn't rename them. Returns `df`
+    itself when the names are already unique.
+    """
+    if not df.columns.duplicated().any():
+        return df
+    seen = {}
+    new_cols = []
+    for col in df.columns:
+        if col in seen:
+            seen[col] += 1
+            new_cols.append(f"{col}__{seen[col]}")
+        else:
+            seen[col] = 0
+            new_cols.append(col)
+    df = df.copy()
+    df.columns = new_cols
+    return df
+
+
 def dataframe_to_rows(df: pd.DataFrame) -> List[Dict]:
-    """Convert DataFrame to list of dicts with string column names."""
+    """
+    Convert DataFrame to list of dicts with string column names. Nulls (NaN, NaT,
+    pd.NA) become None. Built column-wise: each column is converted to a Python list
+    once and the rows are zipped together, instead of boxing cell by cell.
+    """
     # Deduplicate column names before converting to avoid pandas silently
-    # omitting columns — e.g. if _rename_dup_columns couldn't rename them.
-    if df.columns.duplicated().any():
-        seen = {}
-        new_cols = []
-        for col in df.columns:
-            if col in seen:
-                seen[col] += 1
-                new_cols.append(f"{col}__{seen[col]}")
-            else:
-                seen[col] = 0
-                new_cols.append(col)
-        df = df.copy()
-        df.columns = new_cols
-    return df.where(pd.notnull(df), None).to_dict(orient='records')
+    # omitting columns
+    df = _dedup_column_names(df)
+
+    names = list(df.columns)
+    if not names:
+        return [{} for _ in range(len(df))]
+    columns = []
+    for k in range(len(names)):
+        col = df.iloc[:, k]
+        values = col.tolist()
+        # Plain NumPy int/bool columns cannot hold nulls — no mask needed. (Nullable
+        # extension dtypes such as Int64 report the same kind, hence the np.dtype check.)
+        if not (isinstance(col.dtype, np.dtype) and col.dtype.kind in 'iub'):
+            nulls = col.isna()
+            if nulls.any():
+                values = [None if null else v for v, null in zip(values, nulls.tolist())]
+        columns.append(values)
+    return [dict(zip(names, row)) for row in zip(*columns)]
+
+
+def referenced_fields(template: ComparisonTemplate) -> Set[str]:
+    """
+    Every column name execute_template can read from a row: key, compare and display
+    fields, CHANGE_RULE fields, condition fields, and {field} placeholders in
+    outcome labels. Columns outside this set never affect the result.
+    """
+    cm = template.column_mapping
+    fields = set(cm.unique_key) | set(cm.compare_fields) | set(cm.display_fields or [])
+    for rule in template.rules:
+        cfg = rule.config or {}
+        fields.update(cfg.get('fields') or [])
+        fields.update(c.get('field') for c in cfg.get('conditions', []) if c.get('field'))
+        entries = [cfg] + [cfg.get(k) for k in ('only_in_file_b', 'only_in_file_a')]
+        for entry in entries:
+            label = entry.get('outcome_label') if isinstance(entry, dict) else None
+            if isinstance(label, str):
+                fields.update(_OUTCOME_RE.findall(label))
+    return fields
 
 
 def execute_template(template: ComparisonTemplate,
@@ -51,6 +103,9 @@ def execute_template(template: ComparisonTemplate,
         'summary': {'total': int, 'additions': int, 'deletions': int, 'changes': int, 'unchanged': int},
     }
     """
+    # Row dicts, match keys and change detection must all see the same column names
+    df_a = _dedup_column_names(df_a)
+    df_b = _dedup_column_names(df_b)
     rows_a = dataframe_to_rows(df_a)
     rows_b = dataframe_to_rows(df_b)
 
@@ -61,17 +116,29 @@ def execute_template(template: ComparisonTemplate,
     # Determine match method from ROW_MATCH rule if present
     match_method = 'exact'
     fuzzy_threshold = 0.8
+    assignment = 'greedy'
     for rule in template.rules:
         if rule.rule_type == 'ROW_MATCH':
             match_method = rule.config.get('method', 'exact')
             fuzzy_threshold = float(rule.config.get('fuzzy_threshold', 0.8))
+            assignment = rule.config.get('assignment', 'greedy')
             break
 
-    # Match rows
+    # Match rows (composite keys built column-wise, once per file)
+    keys_a = make_keys_vectorized(df_a, key_fields)
+    keys_b = make_keys_vectorized(df_b, key_fields)
     if match_method == 'fuzzy':
-        matched_pairs, only_a, only_b, match_warnings = fuzzy_match(rows_a, rows_b, key_fields, fuzzy_threshold)
+        matched_pairs, only_a, only_b, match_warnings = fuzzy_match(
+            rows_a, rows_b, key_fields, fuzzy_threshold, keys_a=keys_a, keys_b=keys_b,
+            assignment=assignment)
     else:
-        matched_pairs, only_a, only_b, match_warnings = exact_match(rows_a, rows_b, key_fields)
+        matched_pairs, only_a, only_b, match_warnings = exact_match(
+            rows_a, rows_b, key_fields, keys_a=keys_a, keys_b=keys_b)
+
+    # Each rule's config is read (and its conditions compiled) once, not per row
+    prepared_rules = _prepare_rules(template.rules, compare_fields)
+    # Output field order: keys, then display, then compare fields (first occurrence wins)
+    all_data_fields = list(dict.fromkeys(key_fields + display_fields + compare_fields))
 
     result_rows = []
 
@@ -80,68 +147,56 @@ def execute_template(template: ComparisonTemplate,
     # --- Process rows only in B (additions) ---
     for j in only_b:
         row_b = rows_b[j]
-        output_cols = _compute_output_columns('addition', None, row_b, template.rules, compare_fields)
+        output_cols = _compute_output_columns('addition', None, row_b, prepared_rules)
         # Skip if no rule fired and user opted out of unmatched rows
         if not output_cols and not include_unmatched:
             continue
         if 'Remarks' not in output_cols:
             output_cols['Remarks'] = {'label': 'Addition', 'color': '#C6EFCE'}
         rem = output_cols.get('Remarks', {})
-        result_rows.append({
-            **_build_output_row(row_b, key_fields, compare_fields, display_fields),
-            'source': 'B',
-            'output_columns': output_cols,
-            'remarks': rem.get('label', 'Addition'),
-            'color': rem.get('color', '#C6EFCE'),
-            'changed_fields': [],
-            '_row_a': None,
-        })
+        result_rows.append(_build_output_row(
+            row_b, all_data_fields, 'B', output_cols,
+            rem.get('label', 'Addition'), rem.get('color', '#C6EFCE'), [], None))
 
     # --- Process rows only in A (deletions) ---
     for i in only_a:
         row_a = rows_a[i]
-        output_cols = _compute_output_columns('deletion', row_a, None, template.rules, compare_fields)
+        output_cols = _compute_output_columns('deletion', row_a, None, prepared_rules)
         # Skip if no rule fired and user opted out of unmatched rows
         if not output_cols and not include_unmatched:
             continue
         if 'Remarks' not in output_cols:
             output_cols['Remarks'] = {'label': 'Deletion', 'color': '#FFC7CE'}
         rem = output_cols.get('Remarks', {})
-        result_rows.append({
-            **_build_output_row(row_a, key_fields, compare_fields, display_fields),
-            'source': 'A',
-            'output_columns': output_cols,
-            'remarks': rem.get('label', 'Deletion'),
-            'color': rem.get('color', '#FFC7CE'),
-            'changed_fields': [],
-            '_row_a': None,
-        })
+        result_rows.append(_build_output_row(
+            row_a, all_data_fields, 'A', output_cols,
+            rem.get('label', 'Deletion'), rem.get('color', '#FFC7CE'), [], None))
 
     # --- Process matched pairs ---
-    for i, j in matched_pairs:
+    # Changed fields for every pair in one column-wise pass
+    pair_idx = np.array(matched_pairs, dtype=np.intp).reshape(-1, 2)
+    changed_per_pair = fields_changed_vectorized(df_a, df_b, pair_idx, compare_fields)
+    # Only CHANGE and CONDITION rules fire on matched pairs; without condition rules an
+    # unchanged pair can fire nothing, so its rule pass is skipped
+    has_condition_rules = any(rule.rule_type == 'CONDITION_RULE' for rule in template.rules)
+    for (i, j), all_changed in zip(matched_pairs, changed_per_pair):
         row_a = rows_a[i]
         row_b = rows_b[j]
-        all_changed = fields_changed(row_a, row_b, compare_fields)
-        output_cols = _compute_output_columns(
-            'matched', row_a, row_b, template.rules, compare_fields,
-            all_changed_fields=all_changed
-        )
+        if all_changed or has_condition_rules:
+            output_cols = _compute_output_columns('matched', row_a, row_b, prepared_rules,
+                                                  all_changed_fields=all_changed)
+        else:
+            output_cols = {}
         if 'Remarks' not in output_cols:
             if all_changed:
                 output_cols['Remarks'] = {'label': 'Changed', 'color': '#FFEB9C'}
             else:
                 output_cols['Remarks'] = {'label': '', 'color': None}
         rem = output_cols.get('Remarks', {})
-        all_data_fields = list(dict.fromkeys(key_fields + display_fields + compare_fields))
-        result_rows.append({
-            **_build_output_row(row_b, key_fields, compare_fields, display_fields),
-            'source': 'matched',
-            'output_columns': output_cols,
-            'remarks': rem.get('label', ''),
-            'color': rem.get('color', None),
-            'changed_fields': all_changed,
-            '_row_a': {f: row_a.get(f) for f in all_data_fields},
-        })
+        result_rows.append(_build_output_row(
+            row_b, all_data_fields, 'matched', output_cols,
+            rem.get('label', ''), rem.get('color', None), all_changed,
+            {f: row_a.get(f) for f in all_data_fields}))
 
     summary = _build_summary(result_rows)
     result: Dict[str, Any] = {'rows': result_rows, 'summary': summary}
@@ -150,101 +205,138 @@ def execute_template(template: ComparisonTemplate,
     return result
 
 
+# evaluator(context, row_a, row_b, all_changed_fields) → (label, color), or (None, None)
+# when the rule does not fire for that row
+RuleEvaluator = Callable[[str, Optional[Dict], Optional[Dict], Optional[List[str]]],
+                         Tuple[Optional[str], Optional[str]]]
+
+
+def _prepare_rules(rules: list, compare_fields: List[str]) -> List[Tuple[str, RuleEvaluator]]:
+    """
+    Bind every output-producing rule to an evaluator closure, in template order.
+    Returns [(output column, evaluator), ...]; ROW_MATCH, FORMULA_RULE and unknown
+    rule types produce no output and are left out.
+    """
+    prepared = []
+    for rule in rules:
+        evaluator = _make_evaluator(rule, compare_fields)
+        if evaluator is not None:
+            prepared.append((rule.output_column or 'Remarks', evaluator))
+    return prepared
+
+
+def _make_evaluator(rule, compare_fields: List[str]) -> Optional[RuleEvaluator]:
+    """Read a rule's config once and return its evaluator (None for non-output rules)."""
+    rt = rule.rule_type
+    cfg = rule.config
+
+    if rt == 'PRESENCE_RULE':
+        entry_b = cfg.get('only_in_file_b', {})
+        label_b = entry_b.get('outcome_label', 'Addition')
+        color_b = entry_b.get('color', '#C6EFCE')
+        entry_a = cfg.get('only_in_file_a', {})
+        label_a = entry_a.get('outcome_label', 'Deletion')
+        color_a = entry_a.get('color', '#FFC7CE')
+
+        def evaluate_presence(context, row_a, row_b, all_changed_fields):
+            if context == 'addition':
+                return resolve_outcome_label(label_b, row_b) if row_b else label_b, color_b
+            elif context == 'deletion':
+                return resolve_outcome_label(label_a, row_a) if row_a else label_a, color_a
+            return None, None
+        return evaluate_presence
+
+    elif rt == 'CHANGE_RULE':
+        check_fields = cfg.get('fields', compare_fields) or compare_fields
+        check_set = frozenset(check_fields)
+        label = cfg.get('outcome_label', 'Changed')
+        color = cfg.get('color', '#FFEB9C')
+
+        def evaluate_change(context, row_a, row_b, all_changed_fields):
+            if context != 'matched':
+                return None, None
+            if all_changed_fields is not None:
+                # The pair's changed fields come from the column-wise pass; the rule only
+                # needs to know whether any of its fields is among them
+                fired = not check_set.isdisjoint(all_changed_fields)
+            else:
+                fired = bool(fields_changed(row_a, row_b, check_fields)) if row_a and row_b else False
+            if fired:
+                return label, color
+            return None, None
+        return evaluate_change
+
+    elif rt == 'CONDITION_RULE':
+        matches = compile_condition_rule(cfg.get('conditions', []), cfg.get('condition_join', 'AND'))
+        label = cfg.get('outcome_label', 'Flagged')
+        color = cfg.get('color', '#FFC7CE')
+
+        def evaluate_condition_rule(context, row_a, row_b, all_changed_fields):
+            if matches(row_a, row_b):
+                active_row = row_b if row_b is not None else row_a
+                return resolve_outcome_label(label, active_row), color
+            return None, None
+        return evaluate_condition_rule
+
+    return None
+
+
 def _compute_output_columns(context: str,
-                             row_a: Optional[Dict],
-                             row_b: Optional[Dict],
-                             rules: list,
-                             compare_fields: List[str],
-                             all_changed_fields: Optional[List[str]] = None) -> Dict:
+                            row_a: Optional[Dict],
+                            row_b: Optional[Dict],
+                            prepared_rules: List[Tuple[str, RuleEvaluator]],
+                            all_changed_fields: Optional[List[str]] = None) -> Dict:
     """
     Evaluate all rules for a row and return output_columns dict.
 
     context: 'addition' | 'deletion' | 'matched'
+    prepared_rules: _prepare_rules() output for the template
     Returns: {col_name: {'label': str, 'color': str}, ...}
     Priority: first matching rule per output column wins.
     """
     output_columns: Dict[str, Dict] = {}
 
-    for rule in rules:
-        if rule.rule_type in ('ROW_MATCH', 'FORMULA_RULE'):
-            continue
-
-        col_name = rule.output_column or 'Remarks'
+    for col_name, evaluate in prepared_rules:
         if col_name in output_columns:
             continue  # First match wins for this output column
 
-        label, color = _evaluate_rule(rule, row_a, row_b, context, compare_fields, all_changed_fields)
+        label, color = evaluate(context, row_a, row_b, all_changed_fields)
         if label is not None:
             output_columns[col_name] = {'label': label, 'color': color}
 
     return output_columns
 
 
-def _evaluate_rule(rule,
-                   row_a: Optional[Dict],
-                   row_b: Optional[Dict],
-                   context: str,
-                   compare_fields: List[str],
-                   all_changed_fields: Optional[List[str]] = None) -> Tuple[Optional[str], Optional[str]]:
+def _build_output_row(row: Dict, all_fields: List[str], source: str, output_cols: Dict,
+                      remarks: str, color: Optional[str], changed_fields: List[str],
+                      row_a: Optional[Dict]) -> Dict:
     """
-    Evaluate a single rule against a row context.
-    Returns (label, color) if the rule fires, or (None, None) if it doesn't apply.
+    Build one result row: the data fields (all_fields is computed once per run) followed
+    by the result keys, filled into a single dict rather than merged from two.
     """
-    rt = rule.rule_type
-    cfg = rule.config
-
-    if rt == 'PRESENCE_RULE':
-        if context == 'addition':
-            entry = cfg.get('only_in_file_b', {})
-            label = entry.get('outcome_label', 'Addition')
-            color = entry.get('color', '#C6EFCE')
-            return resolve_outcome_label(label, row_b) if row_b else label, color
-        elif context == 'deletion':
-            entry = cfg.get('only_in_file_a', {})
-            label = entry.get('outcome_label', 'Deletion')
-            color = entry.get('color', '#FFC7CE')
-            return resolve_outcome_label(label, row_a) if row_a else label, color
-        return None, None
-
-    elif rt == 'CHANGE_RULE':
-        if context != 'matched':
-            return None, None
-        check_fields = cfg.get('fields', compare_fields) or compare_fields
-        if all_changed_fields is not None:
-            changed = [f for f in check_fields if f in set(all_changed_fields)]
-        else:
-            changed = fields_changed(row_a, row_b, check_fields) if row_a and row_b else []
-        if changed:
-            return cfg.get('outcome_label', 'Changed'), cfg.get('color', '#FFEB9C')
-        return None, None
-
-    elif rt == 'CONDITION_RULE':
-        conditions = cfg.get('conditions', [])
-        join = cfg.get('condition_join', 'AND')
-        if evaluate_conditions(row_a, row_b, conditions, join):
-            active_row = row_b if row_b is not None else row_a
-            label = resolve_outcome_label(cfg.get('outcome_label', 'Flagged'), active_row)
-            return label, cfg.get('color', '#FFC7CE')
-        return None, None
-
-    return None, None
-
-
-def _build_output_row(row: Dict, key_fields: List[str],
-                      compare_fields: List[str], display_fields: List[str]) -> Dict:
-    """Build output row with all relevant fields."""
-    output = {}
-    all_fields = list(dict.fromkeys(key_fields + display_fields + compare_fields))
-    for f in all_fields:
-        output[f] = row.get(f)
-    return output
+    out = {f: row.get(f) for f in all_fields}
+    out['source'] = source
+    out['output_columns'] = output_cols
+    out['remarks'] = remarks
+    out['color'] = color
+    out['changed_fields'] = changed_fields
+    out['_row_a'] = row_a
+    return out
 
 
 def _build_summary(result_rows: List[Dict]) -> Dict:
-    additions = sum(1 for r in result_rows if r.get('source') == 'B')
-    deletions = sum(1 for r in result_rows if r.get('source') == 'A')
-    changes = sum(1 for r in result_rows if r.get('source') == 'matched' and r.get('changed_fields'))
-    unchanged = sum(1 for r in result_rows if r.get('source') == 'matched' and not r.get('changed_fields'))
+    additions = deletions = changes = unchanged = 0
+    for r in result_rows:
+        source = r.get('source')
+        if source == 'B':
+            additions += 1
+        elif source == 'A':
+            deletions += 1
+        elif source == 'matched':
+            if r.get('changed_fields'):
+                changes += 1
+            else:
+                unchanged += 1
     return {
         'total': len(result_rows),
         'additions': additions,
@@ -5,19 +5,25 @@ from dataclasses import dataclass, field
 from typing import Any, Dict, List, Optional
 
 
-VALID_RULE_TYPES = {
-    'PRESENCE_RULE', 'CHANGE_RULE', 'CONDITION_RULE', 'ROW_MATCH', 'FORMULA_RULE'
-}
-
-VALID_OPERATORS = {
+# Ordered so generated text (e.g. the AI prompt schema summary, validation messages)
+# is stable across processes
+RULE_TYPE_NAMES = ('PRESENCE_RULE', 'CHANGE_RULE', 'CONDITION_RULE', 'ROW_MATCH', 'FORMULA_RULE')
+OPERATOR_NAMES = (
     'is_empty', 'is_not_empty', 'equals', 'not_equals', 'contains',
     'starts_with', 'changed_from_empty', 'changed_to_empty',
     'date_is_before', 'date_is_after',
     'changed_from_pattern', 'changed_to_pattern',
-}
+)
+MATCH_METHOD_NAMES = ('exact', 'fuzzy')
+FUZZY_ASSIGNMENT_NAMES = ('greedy', 'optimal')
+FORMULA_ACTION_NAMES = ('compare_value', 'compare_expression', 'skip')
 
-VALID_FORMULA_ACTIONS = {'compare_value', 'compare_expression', 'skip'}
-VALID_MATCH_METHODS = {'exact', 'fuzzy'}
+# Immutable lookup sets for membership checks
+VALID_RULE_TYPES = frozenset(RULE_TYPE_NAMES)
+VALID_OPERATORS = frozenset(OPERATOR_NAMES)
+VALID_FORMULA_ACTIONS = frozenset(FORMULA_ACTION_NAMES)
+VALID_MATCH_METHODS = frozenset(MATCH_METHOD_NAMES)
+VALID_FUZZY_ASSIGNMENTS = frozenset(FUZZY_ASSIGNMENT_NAMES)
 
 
 @dataclass
@@ -91,13 +97,15 @@ class ConditionRuleConfig:
 class RowMatchConfig:
     method: str = 'exact'  # 'exact' | 'fuzzy'
     fuzzy_threshold: float = 0.8
+    assignment: str = 'greedy'  # 'greedy' | 'optimal' (fuzzy only; optimal needs scipy)
 
     def to_dict(self):
-        return {'method': self.method, 'fuzzy_threshold': self.fuzzy_threshold}
+        return {'method': self.method, 'fuzzy_threshold': self.fuzzy_threshold, 'assignment': self.assignment}
 
     @classmethod
     def from_dict(cls, d: Dict) -> 'RowMatchConfig':
-        return cls(method=d.get('method', 'exact'), fuzzy_threshold=float(d.get('fuzzy_threshold', 0.8)))
+        return cls(method=d.get('method', 'exact'), fuzzy_threshold=float(d.get('fuzzy_threshold', 0.8)),
+                   assignment=d.get('assignment', 'greedy'))
 
 
 @dataclass
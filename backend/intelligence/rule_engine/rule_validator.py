@@ -1,12 +1,90 @@
 """
 Validates rule JSON dicts against the schema before executing or storing.
 """
-from typing import Dict, List, Tuple
+from typing import Callable, Dict, List, Tuple
 
 from .rule_schema import (
-    VALID_RULE_TYPES, VALID_OPERATORS, VALID_FORMULA_ACTIONS, VALID_MATCH_METHODS
+    VALID_OPERATORS, VALID_FORMULA_ACTIONS, VALID_MATCH_METHODS,
+    VALID_FUZZY_ASSIGNMENTS, RULE_TYPE_NAMES, MATCH_METHOD_NAMES, FUZZY_ASSIGNMENT_NAMES,
 )
 
+# Default for single-lookup presence checks (a key may legitimately hold None)
+_MISSING = object()
+
+# Allowed-value lists as they appear in error messages, joined once
+_RULE_TYPES_TEXT = ', '.join(RULE_TYPE_NAMES)
+_MATCH_METHODS_TEXT = ', '.join(MATCH_METHOD_NAMES)
+_FUZZY_ASSIGNMENTS_TEXT = ', '.join(FUZZY_ASSIGNMENT_NAMES)
+
+
+def _validate_presence(config: Dict, errors: List[str]) -> None:
+    for key in ['only_in_file_b', 'only_in_file_a']:
+        entry = config.get(key, _MISSING)
+        if entry is not _MISSING:
+            if 'outcome_label' not in entry:
+                errors.append(f"PRESENCE_RULE.{key} missing 'outcome_label'")
+
+
+def _validate_change(config: Dict, errors: List[str]) -> None:
+    if not isinstance(config.get('fields'), list):
+        errors.append("CHANGE_RULE.config must have 'fields' (list)")
+
+
+def _validate_condition(config: Dict, errors: List[str]) -> None:
+    conditions = config.get('conditions', _MISSING)
+    if conditions is _MISSING:
+        errors.append("CONDITION_RULE.config must have 'conditions'")
+    else:
+        # Locals for the per-condition loop (rules can carry dozens of conditions)
+        append = errors.append
+        valid_operators = VALID_OPERATORS
+        for i, cond in enumerate(conditions):
+            if 'field' not in cond:
+                append(f"CONDITION_RULE.conditions[{i}] missing 'field'")
+            op = cond.get('operator')
+            if op not in valid_operators:
+                append(f"CONDITION_RULE.conditions[{i}] invalid operator '{op}'")
+    if 'outcome_label' not in config:
+        errors.append("CONDITION_RULE.config missing 'outcome_label'")
+    join = config.get('condition_join', 'AND')
+    if join not in ('AND', 'OR'):
+        errors.append(f"CONDITION_RULE.condition_join must be 'AND' or 'OR', got '{join}'")
+
+
+def _validate_row_match(config: Dict, errors: List[str]) -> None:
+    method = config.get('method', 'exact')
+    if method not in VALID_MATCH_METHODS:
+        errors.append(f"ROW_MATCH.method must be one of {_MATCH_METHODS_TEXT}")
+    threshold = config.get('fuzzy_threshold', 0.8)
+    try:
+        # Numeric strings are accepted, as execute_template coerces them the same way
+        threshold = float(threshold)
+    except (TypeError, ValueError):
+        errors.append(f"ROW_MATCH.fuzzy_threshold must be a number, got '{threshold}'")
+    else:
+        if not (0.0 <= threshold <= 1.0):
+            errors.append("ROW_MATCH.fuzzy_threshold must be between 0.0 and 1.0")
+    assignment = config.get('assignment', 'greedy')
+    if assignment not in VALID_FUZZY_ASSIGNMENTS:
+        errors.append(f"ROW_MATCH.assignment must be one of {_FUZZY_ASSIGNMENTS_TEXT}")
+
+
+def _validate_formula(config: Dict, errors: List[str]) -> None:
+    actions = config.get('column_actions', {})
+    for col, action in actions.items():
+        if action not in VALID_FORMULA_ACTIONS:
+            errors.append(f"FORMULA_RULE.column_actions['{col}'] invalid action '{action}'")
+
+
+# rule_type → config checker; each appends its messages to `errors`
+_RULE_VALIDATORS: Dict[str, Callable[[Dict, List[str]], None]] = {
+    'PRESENCE_RULE': _validate_presence,
+    'CHANGE_RULE': _validate_change,
+    'CONDITION_RULE': _validate_condition,
+    'ROW_MATCH': _validate_row_match,
+    'FORMULA_RULE': _validate_formula,
+}
+
 
 def validate_rule(rule: Dict) -> Tuple[bool, List[str]]:
     """
@@ -14,65 +92,26 @@ def validate_rule(rule: Dict) -> Tuple[bool, List[str]]:
     """
     errors = []
 
-    if 'rule_type' not in rule:
+    rt = rule.get('rule_type', _MISSING)
+    if rt is _MISSING:
         errors.append("Missing 'rule_type'")
         return False, errors
 
-    rt = rule['rule_type']
-    if rt not in VALID_RULE_TYPES:
-        errors.append(f"Unknown rule_type '{rt}'. Valid: {VALID_RULE_TYPES}")
+    check_config = _RULE_VALIDATORS.get(rt)
+    if check_config is None:
+        errors.append(f"Unknown rule_type '{rt}'. Valid: {_RULE_TYPES_TEXT}")
         return False, errors
 
-    config = rule.get('config', {})
-
-    if rt == 'PRESENCE_RULE':
-        for key in ['only_in_file_b', 'only_in_file_a']:
-            if key in config:
-                entry = config[key]
-                if 'outcome_label' not in entry:
-                    errors.append(f"PRESENCE_RULE.{key} missing 'outcome_label'")
-
-    elif rt == 'CHANGE_RULE':
-        if 'fields' not in config or not isinstance(config['fields'], list):
-            errors.append("CHANGE_RULE.config must have 'fields' (list)")
-
-    elif rt == 'CONDITION_RULE':
-        if 'conditions' not in config:
-            errors.append("CONDITION_RULE.config must have 'conditions'")
-        else:
-            for i, cond in enumerate(config['conditions']):
-                if 'field' not in cond:
-                    errors.append(f"CONDITION_RULE.conditions[{i}] missing 'field'")
-                op = cond.get('operator')
-                if op not in VALID_OPERATORS:
-                    errors.append(f"CONDITION_RULE.conditions[{i}] invalid operator '{op}'")
-        if 'outcome_label' not in config:
-            errors.append("CONDITION_RULE.config missing 'outcome_label'")
-        join = config.get('condition_join', 'AND')
-        if join not in ('AND', 'OR'):
-            errors.append(f"CONDITION_RULE.condition_join must be 'AND' or 'OR', got '{join}'")
-
-    elif rt == 'ROW_MATCH':
-        method = config.get('method', 'exact')
-        if method not in VALID_MATCH_METHODS:
-            errors.append(f"ROW_MATCH.method must be one of {VALID_MATCH_METHODS}")
-        threshold = config.get('fuzzy_threshold', 0.8)
-        if not (0.0 <= float(threshold) <= 1.0):
-            errors.append("ROW_MATCH.fuzzy_threshold must be between 0.0 and 1.0")
-
-    elif rt == 'FORMULA_RULE':
-        actions = config.get('column_actions', {})
-        for col, action in actions.items():
-            if action not in VALID_FORMULA_ACTIONS:
-                errors.append(f"FORMULA_RULE.column_actions['{col}'] invalid action '{action}'")
-
+    check_config(rule.get('config', {}), errors)
     return len(errors) == 0, errors
 
 
-def validate_template(template: Dict) -> Tuple[bool, List[str]]:
+def validate_template(template: Dict, *, fail_fast: bool = False) -> Tuple[bool, List[str]]:
     """
     Validate an entire comparison template dict.
     Returns (is_valid, list_of_errors).
+    fail_fast: return at the first failing stage (required keys, sheet/key mapping, or
+    the first invalid rule) for callers that only need the bool.
     """
     errors = []
 
@@ -80,6 +119,8 @@ def validate_template(template: Dict) -> Tuple[bool, List[str]]:
     for k in required_keys:
         if k not in template:
             errors.append(f"Missing required key: '{k}'")
+            if fail_fast:
+                return False, errors
 
     if errors:
         return False, errors
@@ -89,13 +130,18 @@ def validate_template(template: Dict) -> Tuple[bool, List[str]]:
         errors.append("sheet_config missing 'file_a_sheet'")
 
     cm = template.get('column_mapping', {})
-    if 'unique_key' not in cm or not cm['unique_key']:
+    if not cm.get('unique_key'):
         errors.append("column_mapping must have non-empty 'unique_key'")
 
+    if errors and fail_fast:
+        return False, errors
+
     for i, rule in enumerate(template.get('rules', [])):
         rule_valid, rule_errors = validate_rule(rule)
         if not rule_valid:
             for err in rule_errors:
                 errors.append(f"rules[{i}]: {err}")
+            if fail_fast:
+                break
 
     return len(errors) == 0, errors
@@ -0,0 +1,60 @@
+"""
+execute_template with duplicated column names: match keys and change detection must
+read the same suffixed columns (X, X__1, ...) as the row dicts.
+Run from backend/: python -m pytest tests
+"""
+import numpy as np
+import pandas as pd
+
+from intelligence.rule_engine import ComparisonTemplate, execute_template, dataframe_to_rows
+from intelligence.rule_engine.change_detector import fields_changed, fields_changed_vectorized
+from intelligence.rule_engine.row_matcher import make_key, make_keys_vectorized
+from intelligence.rule_engine.rule_executor import _dedup_column_names
+
+
+def _template(unique_key, compare_fields):
+    return ComparisonTemplate.from_dict({
+        'template_name': 'dup columns',
+        'sheet_config': {'file_a_sheet': 'Sheet1'},
+        'column_mapping': {'unique_key': unique_key, 'compare_fields': compare_fields},
+        'rules': [{'rule_type': 'CHANGE_RULE', 'config': {'fields': compare_fields}}],
+    })
+
+
+def test_change_in_suffixed_duplicate_column_is_reported():
+    columns = ['ID', 'Amount', 'Amount']
+    df_a = pd.DataFrame([[1, 5, 10], [2, 6, 20]], columns=columns)
+    df_b = pd.DataFrame([[1, 5, 11], [2, 6, 20]], columns=columns)
+
+    result = execute_template(_template(['ID'], ['Amount', 'Amount__1']), df_a, df_b)
+
+    changed = {row['ID']: row['changed_fields'] for row in result['rows']}
+    assert changed == {1: ['Amount__1'], 2: []}
+    assert result['summary']['changes'] == 1
+
+
+def test_key_on_suffixed_duplicate_column_matches_rows():
+    columns = ['Code', 'Code', 'Amount']
+    df_a = pd.DataFrame([[1, 'k1', 5], [2, 'k2', 6]], columns=columns)
+    df_b = pd.DataFrame([[9, 'k1', 7], [8, 'k2', 6]], columns=columns)
+
+    result = execute_template(_template(['Code__1'], ['Amount']), df_a, df_b)
+
+    assert result['summary'] == {'total': 2, 'additions': 0, 'deletions': 0, 'changes': 1, 'unchanged': 1}
+    assert [row['source'] for row in result['rows']] == ['matched', 'matched']
+
+
+def test_vectorized_helpers_agree_with_row_dicts_on_colliding_names():
+    # X, X, X__1: the second X is suffixed to X__1, which collides with the third column
+    df_a = pd.DataFrame([[1, 2, 3]], columns=['X', 'X', 'X__1'])
+    df_b = pd.DataFrame([[1, 2, 4]], columns=['X', 'X', 'X__1'])
+    rows_a = dataframe_to_rows(df_a)
+    rows_b = dataframe_to_rows(df_b)
+    df_a = _dedup_column_names(df_a)
+    df_b = _dedup_column_names(df_b)
+
+    assert list(make_keys_vectorized(df_a, ['X', 'X__1'])) == [make_key(rows_a[0], ['X', 'X__1'])]
+    pairs = np.array([[0, 0]])
+    assert fields_changed_vectorized(df_a, df_b, pairs, ['X', 'X__1']) == [
+        fields_changed(rows_a[0], rows_b[0], ['X', 'X__1'])
+    ]
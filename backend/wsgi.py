@@ -0,0 +1,8 @@
+"""
+WSGI entry point for production servers, e.g.
+    gunicorn wsgi:app --workers 1 --worker-class gthread --threads 4
+Sessions are held in process memory, so scale with threads, not workers.
+"""
+from app import app
+
+__all__ = ['app']
@@ -95,6 +95,15 @@ export async function aiNlToRule(description, columns, aiConfig) {
   return parseResponse(res);
 }
 
+export async function aiNlToRules(descriptions, columns, aiConfig) {
+  const res = await fetch(`${BASE}/api/intel/ai/nl-to-rules`, {
+    method: 'POST',
+    headers: { 'Content-Type': 'application/json', ...getAIHeaders(aiConfig) },
+    body: JSON.stringify({ descriptions, columns }),
+  });
+  return parseResponse(res);
+}
+
 export async function aiChat(message, context, aiConfig) {
   const res = await fetch(`${BASE}/api/intel/ai/chat`, {
     method: 'POST',